@@ -1,35 +1,51 @@
+import time
+
+# Startup is measured from here to the first interactive frame
+STARTED_AT = time.perf_counter()
+
+import os
+
+# Keep pygame's support banner off stdout, importing this module prints nothing
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
 import pygame
 import sys
+import argparse
+import functools
 import cv2
 import numpy as np
-from PIL import Image
-import os
-import base64
-from io import BytesIO
-from openai import OpenAI
 from dotenv import load_dotenv
-import time
 import threading
-import re
-
-# Load environment variables from .env file
-load_dotenv()
+from vision_payload import PayloadController
+from vision_client import ResilientVisionClient, CircuitOpenError, VisionTimeoutError
+from rate_limiter import ThrottledError, limiter, limits_from_env
+import strategy
+from hand_history import HandHistoryStore
+from hand import PlayerHands
+from shoe import Shoe
+import keyboard_entry
+from tracing import tracer, traced
+from detector_process import DetectorProcess
+from capture import open_camera, CaptureScheduler
+from state_channel import StateChannel, stabilize_detection
+from dealer_tables import DealerTables, OUTCOMES
+from local_detector import LocalOCRDetector, DetectionCascade
+from card_parsing import (CardDetection, IncrementalCardParser, parse_detection_json, build_detection_messages,
+                          DETECTION_RESPONSE_FORMAT, DETECTION_MAX_TOKENS)
 
-# Get API key from environment variable
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("Please set your OpenAI API key in the .env file as OPENAI_API_KEY=your-key")
+# Seconds from process start to the first frame the user can interact with
+STARTUP_TARGET = 0.5
 
-def encode_image_to_base64(image):
-    # Convert PIL Image to base64 with JPEG compression (quality 80)
-    buffered = BytesIO()
-    image.save(buffered, format="JPEG", quality=80)
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+# Frames are captured at the detection resolution (the largest payload level, the OCR
+# rank corner and the detector ring slots all need it) and only shrunk for display
+CAPTURE_SIZE = (640, 480)
+DISPLAY_SIZE = (320, 240)
 
 class CardCounterCam:
     def __init__(self):
-        # Initialize pygame for GUI
-        pygame.init()
+        # Only the pygame modules the UI uses, full pygame.init() also starts audio
+        pygame.display.init()
+        pygame.font.init()
         self.WINDOW_WIDTH = 1000  # Increased width to accommodate camera feed
         self.WINDOW_HEIGHT = 700  # Increased height to accommodate camera feed
         self.screen = pygame.display.set_mode((self.WINDOW_WIDTH, self.WINDOW_HEIGHT))
@@ -48,29 +64,33 @@ class CardCounterCam:
             "LIGHT_BLUE": (173, 216, 230)
         }
         
-        # Fonts
-        self.title_font = pygame.font.Font(None, 48)
-        self.normal_font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 28)
+        # Text that never changes is rendered once, see static_text
+        self.text_cache = {}
         
         # Game state
-        self.player_cards = []
+        self.player_hands = PlayerHands()  # One hand per split, totals kept incrementally
         self.dealer_up_card = None
         self.running_count = 0
         self.true_count = 0
         self.num_decks = 6  # Standard shoe size
         self.decks_remaining = 6.0
+        self.shoe = Shoe(self.num_decks)  # Exact composition of the cards seen, for insurance
+        self.insurance_by_true_count = False  # Use the true count index instead of the ten density
         
         # Card values for Hi-Lo counting system
-        self.count_values = {
-            '2': 1, '3': 1, '4': 1, '5': 1, '6': 1,
-            '7': 0, '8': 0, '9': 0,
-            '10': -1, 'J': -1, 'Q': -1, 'K': -1, 'A': -1
-        }
+        self.count_values = strategy.COUNT_VALUES
+        
+        # Precomputed dealer outcome probabilities, memory-mapped (build with dealer_tables.py)
+        try:
+            self.dealer_tables = DealerTables()
+        except FileNotFoundError:
+            self.dealer_tables = None
+        self.dealer_odds_key = None
+        self.dealer_odds_surface = None
         
         # Button definitions
         self.card_buttons = []
-        cards = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+        cards = strategy.CARDS
         button_width = 50
         button_height = 50
         button_gap = 10
@@ -102,6 +122,11 @@ class CardCounterCam:
                 'rect': pygame.Rect(500, 480, button_width, button_height),
                 'text': 'New Hand',
                 'action': 'reset'
+            },
+            {
+                'rect': pygame.Rect(675, 480, button_width, button_height),
+                'text': 'Split',
+                'action': 'split'
             }
         ]
         
@@ -128,6 +153,13 @@ class CardCounterCam:
         
         self.selected_card = None
         self.selected_action = None
+        self.keyboard_entry = keyboard_entry.KeyboardEntry()  # F2: one keystroke per card
+        
+        # F9 (or CARDCOUNTER_TRACE=1 at startup) records a Chrome trace,
+        # CARDCOUNTER_PROFILE=1 adds a cProfile dump of the UI thread
+        self.trace_dir = os.getenv('CARDCOUNTER_TRACE_DIR', 'traces')
+        if os.getenv('CARDCOUNTER_TRACE') == '1':
+            tracer.start(profile=os.getenv('CARDCOUNTER_PROFILE') == '1')
         self.input_mode = None
         self.message = ""
         self.message_timer = 0
@@ -135,145 +167,227 @@ class CardCounterCam:
         # Camera-related attributes
         self.camera_enabled = False
         self.camera_thread = None
-        self.camera_running = False
-        self.camera_surface = None
-        self.detected_card = None
+        self.camera_stop = threading.Event()  # Set to ask the camera thread to exit
         self.last_detected_card = None
-        self.detection_confidence = "No detection"
-        self.detection_confirmed = False  # Flag to track if detection is confirmed
-        self.detection_stability_count = 0  # Counter for stable detections
-        self.last_detection_time = 0  # Time of last detection
+        self.min_detection_confidence = 0.6  # Below this a detection is ignored
         self.detection_cooldown = 1.0  # Cooldown period in seconds
-        self.fps = 0  # Store FPS for display
-        self.api_processing = False  # Flag to prevent multiple API calls at once
-        
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
+        self.max_detection_workers = 1  # API calls allowed in flight at once
+        self.send_interval = 1.0  # Seconds between frames sent for detection
+        self.required_confirmations = 2  # Agreeing results in a row before a card counts
+        # Backend name to run detection in a separate process (e.g. CARDCOUNTER_DETECTOR=openai)
+        self.detector_backend = os.getenv('CARDCOUNTER_DETECTOR')
+        
+        # Camera and detection threads publish snapshots here, the UI reads one per frame
+        self.camera_state = StateChannel()
+        self.state = self.camera_state.snapshot
+        self.handled_detection_id = 0  # Last confirmed detection the UI has acted on
+        self.shown_notice_id = 0
+        self.payload_controller = PayloadController()  # Adapts image size/quality to latency
+        self.stream_detection = True  # Commit the rank from the first streamed tokens
+        
+        # Optional shared count server for team play (see count_server.py)
+        server_url = os.getenv('COUNT_SERVER_URL')
+        self.count_client = None
+        # Only the spotter running the table starts hands and resets the shared shoe for everyone
+        self.controls_table = os.getenv('COUNT_SERVER_CONTROLS_TABLE') == '1'
+        if server_url:
+            from count_server import CountServerClient
+            self.count_client = CountServerClient(server_url)
+        
+        # Every finished hand is appended to the columnar hand history
+        self.hand_history = HandHistoryStore(os.getenv('HAND_HISTORY_DIR', 'hand_history'), chunk_size=256)
+        self.decision = None  # Count and recommendation when the hand was first decidable
+        
+        # The vision client and detection cascade are built on first use (see the properties below),
+        # each under its own lock so building one never blocks a reader of the other
+        self.client_lock = threading.Lock()
+        self.cascade_lock = threading.Lock()
+        self._client = None
+        self._detection_cascade = None
+        self.startup_time = None  # Seconds to the first interactive frame
 
-    def calculate_hand_value(self, cards):
-        value = 0
-        aces = 0
-        
-        for card in cards:
-            if card in ['J', 'Q', 'K']:
-                value += 10
-            elif card == 'A':
-                aces += 1
-            else:
-                value += int(card)
-        
-        # Add aces
-        for _ in range(aces):
-            if value + 11 <= 21:
-                value += 11
-            else:
-                value += 1
-                
-        return value
+    # Fonts are loaded when the first frame is drawn, after the window is up
+    @functools.cached_property
+    def title_font(self):
+        return pygame.font.Font(None, 48)
+
+    @functools.cached_property
+    def normal_font(self):
+        return pygame.font.Font(None, 36)
+
+    @functools.cached_property
+    def small_font(self):
+        return pygame.font.Font(None, 28)
+
+    @property
+    def client(self):
+        """Vision API client, created on the first detection since importing the SDK is slow"""
+        if self._client is not None:
+            return self._client
+        with self.client_lock:
+            if self._client is None:
+                from openai import OpenAI
+                api_key = os.getenv('OPENAI_API_KEY')
+                if not api_key:
+                    raise ValueError("Please set your OpenAI API key in the .env file as OPENAI_API_KEY=your-key")
+                # Deadlines, hedging and a circuit breaker; the live table has priority
+                # over background sources in the shared rate limiter
+                self._client = ResilientVisionClient(OpenAI(api_key=api_key), source='table', priority='high')
+            return self._client
+
+    @property
+    def detection_cascade(self):
+        """Local OCR on the rank corner, escalating to the cloud when unsure"""
+        if self._detection_cascade is not None:
+            return self._detection_cascade
+        with self.cascade_lock:
+            if self._detection_cascade is None:
+                local_detector = LocalOCRDetector()
+                tiers = [('ocr', local_detector.detect, 0.85)] if local_detector.available else []
+                # With the cloud down or throttled, a less confident OCR answer beats none
+                self._detection_cascade = DetectionCascade(tiers + [('cloud', self.detect_with_api, None)],
+                                                           unavailable_errors=(CircuitOpenError, ThrottledError))
+            return self._detection_cascade
+
+    def static_text(self, text, font_name, color):
+        """Surface for text that never changes, rendered on first use only"""
+        key = (text, font_name, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = getattr(self, font_name).render(text, True, color)
+            self.text_cache[key] = surface
+        return surface
 
     def get_recommendation(self):
-        if not self.player_cards or not self.dealer_up_card:
-            return "Need player and dealer cards"
-            
-        player_value = self.calculate_hand_value(self.player_cards)
-        
-        if self.dealer_up_card in ['J', 'Q', 'K']:
-            dealer_value = 10
-        elif self.dealer_up_card == 'A':
-            dealer_value = 11
-        else:
-            dealer_value = int(self.dealer_up_card)
-        
-        # Basic strategy with count considerations
-        if player_value <= 8:
-            return "Hit"
-        elif player_value == 9:
-            if dealer_value in [3,4,5,6] and self.true_count >= 1:
-                return "Double Down"
-            return "Hit"
-        elif player_value == 10:
-            if dealer_value <= 9:
-                return "Double Down"
-            return "Hit"
-        elif player_value == 11:
-            return "Double Down"
-        elif player_value == 12:
-            if dealer_value in [4,5,6]:
-                return "Stand"
-            return "Hit"
-        elif 13 <= player_value <= 16:
-            if dealer_value <= 6:
-                return "Stand"
-            return "Hit"
-        else:  # 17 or higher
-            return "Stand"
-
-    def update_count(self, card):
+        return strategy.get_recommendation(self.player_hands.active, self.dealer_up_card, self.true_count)
+
+    def update_count(self, card, target='other'):
         if card in self.count_values:
             self.running_count += self.count_values[card]
             self.true_count = self.running_count / self.decks_remaining
+            self.shoe.add(card)
+            if self.count_client:
+                self.count_client.send('card', card=card, target=target)
+            if self.decision is None and len(self.player_hands.active) >= 2 and self.dealer_up_card:
+                self.decision = (self.running_count, self.true_count, self.decks_remaining,
+                                 self.get_recommendation())
+
+    def record_hand(self):
+        """Store the current hands (one row per split hand) in the hand history"""
+        if not self.player_hands:
+            return
+        running_count, true_count, decks_remaining, recommendation = self.decision or \
+            (self.running_count, self.true_count, self.decks_remaining, self.get_recommendation())
+        for hand, outcome in zip(self.player_hands, self.player_hands.outcomes):
+            self.hand_history.append(hand, self.dealer_up_card, running_count, true_count,
+                                     decks_remaining, recommendation, outcome)
+        self.decision = None
 
     def parse_card_from_response(self, response_text):
-        """Extract card value from the API response"""
-        if "no card" in response_text.lower():
-            return None, "No card detected"
-            
+        """Extract the most confident card from a structured API response"""
+        try:
+            cards = parse_detection_json(response_text)
+        except ValueError as e:
+            return None, f"Unrecognized: {e}", 0.0
+        return self.best_card(cards)
+
+    def best_card(self, cards):
+        """Card value, status text and confidence from detections sorted by confidence"""
+        if not cards:
+            return None, "No card detected", 0.0
+        best = cards[0]
+        if best.confidence < self.min_detection_confidence:
+            return None, f"Unsure: {best.describe()}", best.confidence
+        return best.rank, best.describe(), best.confidence
+
+    def stream_card_from_api(self, messages):
+        """Stream the API response and return as soon as the rank is unambiguous"""
+        parser = IncrementalCardParser()
+        stream = self.client.stream(model="gpt-4o", messages=messages, max_tokens=DETECTION_MAX_TOKENS,
+                                    response_format=DETECTION_RESPONSE_FORMAT)
+        try:
+            for delta in stream:
+                if parser.feed(delta):
+                    break
+        finally:
+            stream.close()
+        
+        if parser.no_card:
+            return []
+        if parser.rank is None:
+            # Stream ended early, validate whatever arrived
+            return parse_detection_json(parser.text)
+        return [CardDetection(parser.rank, '?', parser.confidence)]
+
+    def detect_with_api(self, frame):
+        """Cloud detection tier: cards found by the vision API, most confident first"""
+        # Encode straight from the BGR frame at the controller's current level
+        base64_image, payload_level = self.payload_controller.encode(frame)
+        request_start = time.time()
+        messages = build_detection_messages(base64_image)
+        
         try:
-            # Try to match standard patterns like "7 of hearts" or "King of spades"
-            match = re.search(r'(\d+|[JQKA])[^\w]+(of)[^\w]+(hearts|diamonds|clubs|spades)', response_text.lower())
-            if match:
-                value = match.group(1)
-                suit = match.group(3)
-                if value.lower() == 'j':
-                    value = 'J'
-                elif value.lower() == 'q':
-                    value = 'Q'
-                elif value.lower() == 'k':
-                    value = 'K'
-                elif value.lower() == 'a':
-                    value = 'A'
-                return value, f"{value} of {suit}"
+            if self.stream_detection:
+                cards = self.stream_card_from_api(messages)
             else:
-                # If we don't find a perfect match but the response contains a valid card value
-                for value in ['10', 'J', 'Q', 'K', 'A', '2', '3', '4', '5', '6', '7', '8', '9']:  # Check 10 first to avoid matching in "10" in other numbers
-                    if value.lower() in response_text.lower():
-                        return value, f"Detected: {response_text}"
-                
-                return None, f"Unrecognized: {response_text}"
-        except Exception as e:
-            return None, f"Error: {str(e)}"
+                response = self.client.create(model="gpt-4o", messages=messages,
+                                              max_tokens=DETECTION_MAX_TOKENS,
+                                              response_format=DETECTION_RESPONSE_FORMAT)
+                cards = parse_detection_json(response.choices[0].message.content)
+        except ValueError:
+            self.payload_controller.record(time.time() - request_start, False, payload_level)
+            raise
+        except VisionTimeoutError:
+            # The slowest requests are the ones the controller most needs to see
+            self.payload_controller.record(self.client.timeout, None, payload_level)
+            raise
+        except (CircuitOpenError, ThrottledError):
+            # Refused locally, nothing was sent at this level
+            raise
+        except Exception:
+            self.payload_controller.record(time.time() - request_start, None, payload_level)
+            raise
+        
+        parsed = not cards or cards[0].confidence >= self.min_detection_confidence
+        self.payload_controller.record(time.time() - request_start, parsed, payload_level)
+        return cards
 
     def camera_function(self):
         """Process camera feed and detect cards"""
-        # Initialize camera
-        cap = cv2.VideoCapture(0)
+        # Initialize camera at the detection resolution
+        cap, _ = open_camera(0, CAPTURE_SIZE)
         if not cap.isOpened():
-            self.message = "Failed to open camera"
-            self.message_timer = 180
-            self.camera_running = False
+            self.camera_state.notify("Failed to open camera")
+            self.camera_state.publish(camera_running=False)
             return
             
-        # Set camera properties for better performance
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        cap.set(cv2.CAP_PROP_FPS, 30)
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer for real-time processing
-            
+        # Built here rather than on the UI thread, probing for tesseract runs a subprocess
+        self.detection_cascade
+        
+        # Full rate while cards are being dealt, slow polling when the table is static
+        scheduler = CaptureScheduler()
+        
         # Initialize variables
         frame_count = 0
         start_time = time.time()
         last_sent_time = 0
-        send_interval = 1.0  # Seconds between API calls
-        last_detection = None
-        detection_count = 0
-        
-        # Start API processing thread
-        api_thread = None
-        
-        self.camera_running = True
-        while self.camera_running:
+        frame_seq = 0
+        workers = threading.BoundedSemaphore(self.max_detection_workers)
+        api_threads = []
+        
+        # Optionally move detection to its own process, fed through shared memory
+        detector = None
+        if self.detector_backend:
+            detector = DetectorProcess(self.detector_backend, workers=self.max_detection_workers)
+            results_thread = threading.Thread(target=self.detector_results_function, args=(detector,))
+            results_thread.daemon = True
+            results_thread.start()
+        
+        self.camera_state.publish(camera_running=True)
+        while not self.camera_stop.is_set():
             # Capture frame
-            ret, frame = cap.read()
+            with tracer.span('camera_read'):
+                ret, frame = cap.read()
             if not ret:
                 break
                 
@@ -281,108 +395,108 @@ class CardCounterCam:
             frame_count += 1
             elapsed_time = time.time() - start_time
             if elapsed_time >= 1.0:
-                self.fps = frame_count / elapsed_time
+                self.camera_state.publish(fps=frame_count / elapsed_time, capture_idle=scheduler.idle)
                 frame_count = 0
                 start_time = time.time()
-                
-            # Resize frame for display (smaller for better performance)
-            resized_frame = cv2.resize(frame, (320, 240))
             
-            # Convert frame for pygame display
-            pygame_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-            # Rotate 90 degrees clockwise to match display orientation
-            pygame_frame = np.rot90(pygame_frame, k=1)
-            self.camera_surface = pygame.surfarray.make_surface(pygame_frame)
+            scheduler.observe(frame)
+            
+            # Only rebuild the display surface when the picture actually changed
+            if scheduler.changed:
+                with tracer.span('camera_display'):
+                    # Shrink for display only, detection gets the full frame
+                    resized_frame = cv2.resize(frame, DISPLAY_SIZE, interpolation=cv2.INTER_AREA)
+                    
+                    # Convert frame for pygame display
+                    pygame_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
+                    # Rotate 90 degrees clockwise to match display orientation
+                    pygame_frame = np.rot90(pygame_frame, k=1)
+                    self.camera_state.publish(camera_surface=pygame.surfarray.make_surface(pygame_frame))
             
-            # Process for card detection in a separate thread to avoid blocking the main loop
+            # Process for card detection in a separate thread to avoid blocking the main loop.
+            # A static scene has already been sent, so detection pauses while idle
             current_time = time.time()
-            if current_time - last_sent_time >= send_interval and not self.api_processing:
-                self.api_processing = True
+            if detector:
+                if not scheduler.idle and current_time - last_sent_time >= self.send_interval and \
+                   detector.submit(frame, frame_seq + 1):
+                    last_sent_time = current_time
+                    frame_seq += 1
+            elif not scheduler.idle and current_time - last_sent_time >= self.send_interval and \
+               workers.acquire(blocking=False):
                 last_sent_time = current_time
+                frame_seq += 1
                 
                 # Make a copy of the frame for the API thread
                 api_frame = frame.copy()
                 
                 # Process in a separate thread
-                def process_frame(frame):
+                @traced('detect_frame')
+                def process_frame(frame, seq):
                     try:
-                        # Prepare image for API - use lower resolution for faster processing
-                        small_frame = cv2.resize(frame, (320, 240))
-                        pil_image = Image.fromarray(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB))
-                        base64_image = encode_image_to_base64(pil_image)
+                        # Local OCR first, the vision API only for frames it can't settle
+                        cards, tier = self.detection_cascade.detect(frame)
+                        card_value, status_text, confidence = self.best_card(cards)
+                        status_text = f"{status_text} [{tier}]"
                         
-                        # Call OpenAI Vision API
-                        response = self.client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {
-                                            "type": "text", 
-                                            "text": "Look at this image and identify if there is a playing card visible. If there is a card, respond with the card's value (2-10, J, Q, K, A) and suit (hearts, diamonds, clubs, spades) in the format 'value of suit' (e.g., '7 of hearts' or 'King of spades'). If no card is clearly visible, respond with 'No card detected'."
-                                        },
-                                        {
-                                            "type": "image_url",
-                                            "image_url": {
-                                                "url": f"data:image/jpeg;base64,{base64_image}"
-                                            }
-                                        }
-                                    ]
-                                }
-                            ],
-                            max_tokens=20
-                        )
-                        
-                        # Parse response
-                        text = response.choices[0].message.content.strip()
-                        card_value, confidence_text = self.parse_card_from_response(text)
-                        
-                        # Implement detection stability check
-                        nonlocal last_detection, detection_count
-                        if card_value == last_detection:
-                            detection_count += 1
-                        else:
-                            detection_count = 1
-                            last_detection = card_value
-                        
-                        # Only update detection if we have consistent readings or clear "no card"
-                        if detection_count >= 2 or card_value is None:
-                            self.detected_card = card_value
-                            self.detection_confidence = confidence_text
-                            
-                            # Set detection confirmed flag if we have a valid card
-                            if card_value is not None:
-                                self.detection_confirmed = True
-                                self.last_detection_time = time.time()
+                        # Detection stability check, applied atomically to the shared state
+                        self.camera_state.update(lambda state: stabilize_detection(
+                            state, seq, card_value, status_text, confidence, time.time(),
+                            self.required_confirmations))
+                    
+                    except CircuitOpenError:
+                        # Upstream is degraded, fall back to manual entry until it recovers
+                        self.camera_state.publish(detection_status="Vision API unavailable - enter cards manually")
+                    
+                    except ThrottledError:
+                        # Over the shared request budget, skip this frame and keep the last result
+                        self.camera_state.publish(detection_status="Rate limited - skipping frames")
                     
                     except Exception as e:
-                        self.detection_confidence = f"Error: {str(e)}"
+                        self.camera_state.publish(detection_status=f"Error: {str(e)}")
                     
                     finally:
-                        self.api_processing = False
+                        workers.release()
                 
                 # Start the processing thread
-                api_thread = threading.Thread(target=process_frame, args=(api_frame,))
+                api_thread = threading.Thread(target=process_frame, args=(api_frame, frame_seq))
                 api_thread.daemon = True
                 api_thread.start()
+                api_threads = [t for t in api_threads if t.is_alive()] + [api_thread]
             
-            # Brief sleep to yield CPU time and improve responsiveness
-            time.sleep(0.001)
+            # Yield CPU time, or poll slowly while the scene is static
+            self.camera_stop.wait(scheduler.delay() or 0.001)
                     
         # Release camera
         cap.release()
+        self.camera_state.publish(camera_running=False)
         
-        # Wait for API thread to complete if it's running
-        if api_thread and api_thread.is_alive():
+        # Wait for API threads to complete if they're running
+        for api_thread in api_threads:
             api_thread.join(timeout=0.5)
+        if detector:
+            results_thread.join(timeout=0.5)
+            detector.close()
+
+    def detector_results_function(self, detector):
+        """Apply results coming back from the detector process"""
+        while not self.camera_stop.is_set():
+            result = detector.get_result(timeout=0.2)
+            if result is None:
+                continue
+            seq, cards, error, latency = result
+            if error:
+                self.camera_state.publish(detection_status=f"Error: {error}")
+                continue
+            card_value, status_text, confidence = self.best_card(cards)
+            self.camera_state.update(lambda state: stabilize_detection(
+                state, seq, card_value, status_text, confidence, time.time(), self.required_confirmations))
 
     def toggle_camera(self):
         """Toggle camera on/off"""
         if self.camera_enabled:
             # Turn off camera
             self.camera_enabled = False
-            self.camera_running = False
+            self.camera_stop.set()
             if self.camera_thread and self.camera_thread.is_alive():
                 self.camera_thread.join(timeout=1.0)
             self.message = "Camera disabled"
@@ -390,35 +504,49 @@ class CardCounterCam:
         else:
             # Turn on camera
             self.camera_enabled = True
+            self.camera_stop.clear()
             self.camera_thread = threading.Thread(target=self.camera_function)
             self.camera_thread.daemon = True  # Thread will close when main program exits
             self.camera_thread.start()
             self.message = "Camera enabled"
             self.message_timer = 90
 
+    def detection_pending(self):
+        """True if the current snapshot holds a confirmed card not yet acted on"""
+        return bool(self.state.detected_card) and self.state.detection_id > self.handled_detection_id
+
+    def split_hand(self):
+        """Split the active hand if it is a pair"""
+        if self.player_hands.active.is_pair:
+            self.player_hands.split()
+            self.message = f"Split into {len(self.player_hands)} hands, N = next hand"
+        else:
+            self.message = "Only a pair can be split"
+        self.message_timer = 90
+
     def handle_detected_card(self):
         """Process detected card from camera if available"""
         # Skip if no detection or same as last processed card
-        if not self.detected_card or not self.detection_confirmed:
+        if not self.detection_pending():
             return
             
-        # Reset confirmation flag
-        self.detection_confirmed = False
+        # Mark this confirmation as handled
+        self.handled_detection_id = self.state.detection_id
         
         # Store the card we're about to process
-        current_card = self.detected_card
+        current_card = self.state.detected_card
         self.last_detected_card = current_card
         
         # Add card based on selected action
         if self.input_mode == 'player':
-            self.player_cards.append(current_card)
-            self.update_count(current_card)
+            self.player_hands.add(current_card)
+            self.update_count(current_card, 'player')
             self.message = f"Added {current_card} to player hand"
             self.message_timer = 90
         elif self.input_mode == 'dealer':
             # For dealer, replace the current card
             self.dealer_up_card = current_card
-            self.update_count(current_card)
+            self.update_count(current_card, 'dealer')
             self.message = f"Set dealer up card to {current_card}"
             self.message_timer = 90
         else:
@@ -426,13 +554,80 @@ class CardCounterCam:
             self.message = f"Detected {current_card}. Select 'Add Player Card' or 'Set Dealer Card'"
             self.message_timer = 120
 
+    def apply_keyboard_entries(self):
+        """Apply every keystroke buffered this frame as one batch"""
+        entries = self.keyboard_entry.drain()
+        if not entries:
+            return
+        
+        # What happened, in key order, grouped into runs of the same kind for the message
+        steps = []
+        
+        def step(kind, label=None):
+            if steps and steps[-1][0] == kind:
+                steps[-1][1].append(label)
+            else:
+                steps.append((kind, [label]))
+        
+        for entry in entries:
+            if entry[0] == 'undo':
+                undone = self.undo_keyboard_entry()
+                if undone:
+                    step('undid', undone)
+                else:
+                    step('nothing to undo')
+                continue
+            
+            _, card, target = entry
+            if target == 'player':
+                hand = self.player_hands.active
+                hand.add(card)
+                self.keyboard_entry.undo_stack.append((card, target, hand))
+            elif target == 'dealer':
+                self.keyboard_entry.undo_stack.append((card, target, self.dealer_up_card))
+                self.dealer_up_card = card
+            else:
+                self.keyboard_entry.undo_stack.append((card, target, None))
+            self.update_count(card, target)
+            step('entered', self.keyboard_entry_label(card, target))
+        
+        message = ", ".join(kind if kind == 'nothing to undo' else f"{kind} {' '.join(labels)}"
+                            for kind, labels in steps)
+        self.message = message[0].upper() + message[1:]
+        self.message_timer = 90
+
+    @staticmethod
+    def keyboard_entry_label(card, target):
+        return card if target == 'player' else f"{card}({target[0]})"
+
+    def undo_keyboard_entry(self):
+        """Revert the last card entered from the keyboard, returns its label or None if there was none"""
+        if not self.keyboard_entry.undo_stack:
+            return None
+        
+        card, target, previous = self.keyboard_entry.undo_stack.pop()
+        if target == 'player' and previous.cards and previous.cards[-1] == card:
+            previous.pop()
+        elif target == 'dealer':
+            self.dealer_up_card = previous
+        self.running_count -= self.count_values[card]
+        self.true_count = self.running_count / self.decks_remaining
+        self.shoe.remove(card)
+        if self.count_client:
+            self.count_client.send('remove', card=card, target=target)
+        return self.keyboard_entry_label(card, target)
+
+    @traced()
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
             
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q:
+                if self.keyboard_entry.handle_key(event):
+                    # Buffered by keyboard entry mode, applied once after the event loop
+                    pass
+                elif event.key == pygame.K_q:
                     self.running = False
                 elif event.key == pygame.K_UP:
                     self.decks_remaining = min(8, self.decks_remaining + 0.5)
@@ -442,14 +637,34 @@ class CardCounterCam:
                     self.true_count = self.running_count / self.decks_remaining
                 elif event.key == pygame.K_c:
                     self.toggle_camera()
-                elif event.key == pygame.K_p and self.detected_card and self.detection_confirmed:
+                elif event.key == pygame.K_p and self.detection_pending():
                     # Shortcut to add detected card to player hand
                     self.input_mode = 'player'
                     self.handle_detected_card()
-                elif event.key == pygame.K_d and self.detected_card and self.detection_confirmed:
+                elif event.key == pygame.K_d and self.detection_pending():
                     # Shortcut to set detected card as dealer card
                     self.input_mode = 'dealer'
                     self.handle_detected_card()
+                elif event.key == pygame.K_s:
+                    self.split_hand()
+                elif event.key == pygame.K_F9:
+                    self.toggle_tracing()
+                elif event.key == pygame.K_n:
+                    # Move on to the next split hand
+                    if self.player_hands.next_hand():
+                        self.message = f"Playing hand {self.player_hands.active_index + 1} of {len(self.player_hands)}"
+                        self.message_timer = 90
+                elif event.key == pygame.K_i:
+                    self.insurance_by_true_count = not self.insurance_by_true_count
+                    self.message = f"Insurance by {'true count' if self.insurance_by_true_count else 'ten density'}"
+                    self.message_timer = 90
+                elif event.key in (pygame.K_w, pygame.K_l, pygame.K_t):
+                    # Outcome of the active hand, stored when "New Hand" is clicked
+                    outcome = {pygame.K_w: 'win', pygame.K_l: 'loss', pygame.K_t: 'push'}[event.key]
+                    self.player_hands.set_outcome(outcome)
+                    self.message = f"Hand {self.player_hands.active_index + 1} outcome: {outcome}" \
+                        if len(self.player_hands) > 1 else f"Hand outcome: {outcome}"
+                    self.message_timer = 90
             
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 # Check card buttons
@@ -463,8 +678,8 @@ class CardCounterCam:
                     if button['rect'].collidepoint(event.pos):
                         if button['action'] == 'player':
                             if self.selected_card:
-                                self.player_cards.append(self.selected_card)
-                                self.update_count(self.selected_card)
+                                self.player_hands.add(self.selected_card)
+                                self.update_count(self.selected_card, 'player')
                                 self.message = f"Added {self.selected_card} to player hand"
                                 self.message_timer = 90
                                 self.selected_card = None
@@ -476,7 +691,7 @@ class CardCounterCam:
                         elif button['action'] == 'dealer':
                             if self.selected_card:
                                 self.dealer_up_card = self.selected_card
-                                self.update_count(self.selected_card)
+                                self.update_count(self.selected_card, 'dealer')
                                 self.message = f"Set dealer up card to {self.selected_card}"
                                 self.message_timer = 90
                                 self.selected_card = None
@@ -486,10 +701,18 @@ class CardCounterCam:
                                 self.message_timer = 90
                         
                         elif button['action'] == 'reset':
-                            self.player_cards = []
+                            self.record_hand()
+                            self.player_hands = PlayerHands()
                             self.dealer_up_card = None
+                            # Undo only reaches back to cards of the current hand
+                            self.keyboard_entry.undo_stack.clear()
+                            if self.count_client and self.controls_table:
+                                self.count_client.send('new_hand')
                             self.message = "Started new hand"
                             self.message_timer = 90
+                        
+                        elif button['action'] == 'split':
+                            self.split_hand()
                         break
                 
                 # Check control buttons
@@ -507,19 +730,38 @@ class CardCounterCam:
                             self.running_count = 0
                             self.true_count = 0
                             self.decks_remaining = 6.0
+                            self.shoe.reset()
+                            # The entries on the stack were counted in the old shoe
+                            self.keyboard_entry.undo_stack.clear()
                             self.message = "Reset count to 0"
+                            if self.count_client and self.controls_table:
+                                self.count_client.send('reset_shoe')
                             self.message_timer = 90
                             
                         elif button['action'] == 'toggle_camera':
                             self.toggle_camera()
                         break
         
+        self.apply_keyboard_entries()
+        
         # Process detected card with cooldown to prevent accidental additions
         current_time = time.time()
-        if self.camera_enabled and self.detected_card and self.detection_confirmed and \
-           (current_time - self.last_detection_time) > self.detection_cooldown:
+        if self.camera_enabled and self.detection_pending() and \
+           (current_time - self.state.last_detection_time) > self.detection_cooldown:
             self.handle_detected_card()
 
+    def dealer_odds(self):
+        """Rendered dealer odds line, rebuilt only when the up card or true count bucket changes"""
+        if not self.dealer_tables or not self.dealer_up_card:
+            return None
+        key = (self.dealer_up_card, self.dealer_tables.bucket(self.true_count))
+        if key != self.dealer_odds_key:
+            odds = self.dealer_tables.lookup(self.dealer_up_card, self.true_count)
+            text = "Dealer " + " ".join(f"{outcome}:{p:.0%}" for outcome, p in zip(OUTCOMES, odds))
+            self.dealer_odds_surface = self.small_font.render(text, True, self.colors["WHITE"])
+            self.dealer_odds_key = key
+        return self.dealer_odds_surface
+    
     def draw_button(self, rect, text, color=None, text_color=None, highlight=False):
         if color is None:
             color = self.colors["GRAY"]
@@ -534,15 +776,16 @@ class CardCounterCam:
         
         pygame.draw.rect(self.screen, self.colors["BLACK"], rect, 2)  # Border
         
-        text_surf = self.small_font.render(text, True, text_color)
+        text_surf = self.static_text(text, 'small_font', text_color)
         text_rect = text_surf.get_rect(center=rect.center)
         self.screen.blit(text_surf, text_rect)
 
+    @traced()
     def draw(self):
         self.screen.fill(self.colors["GREEN"])
         
         # Draw title
-        title = self.title_font.render("Blackjack Card Counter with Camera", True, self.colors["WHITE"])
+        title = self.static_text("Blackjack Card Counter with Camera", 'title_font', self.colors["WHITE"])
         self.screen.blit(title, title.get_rect(center=(self.WINDOW_WIDTH/2, 50)))
         
         # Draw counts
@@ -553,61 +796,106 @@ class CardCounterCam:
         self.screen.blit(true_count_text, (50, 140))
         self.screen.blit(decks_text, (50, 180))
         
+        # Shared table count from the count server, once it has sent its state
+        server_state = self.count_client.state if self.count_client else None
+        if server_state:
+            table_count_text = self.normal_font.render(
+                f"Table: RC {server_state['running_count']} TC {server_state['true_count']:.1f}",
+                True, self.colors["YELLOW"])
+            table_decks_text = self.small_font.render(
+                f"{server_state['decks_remaining']:.1f} decks left, {server_state['cards_seen']} cards seen",
+                True, self.colors["YELLOW"])
+            self.screen.blit(table_count_text, (350, 100))
+            self.screen.blit(table_decks_text, (350, 140))
+        elif self.count_client and self.count_client.error:
+            server_error_text = self.small_font.render(f"Count server: {self.count_client.error[:40]}",
+                                                       True, self.colors["RED"])
+            self.screen.blit(server_error_text, (350, 100))
+        
         # Draw player and dealer cards
-        player_text = self.normal_font.render("Player Cards:", True, self.colors["WHITE"])
+        player_text = self.static_text("Player Cards:", 'normal_font', self.colors["WHITE"])
         self.screen.blit(player_text, (50, 230))
         
-        if self.player_cards:
-            player_cards_text = self.normal_font.render(", ".join(self.player_cards), True, self.colors["LIGHT_BLUE"])
-            self.screen.blit(player_cards_text, (250, 230))
-            player_value = self.calculate_hand_value(self.player_cards)
-            player_value_text = self.normal_font.render(f"Value: {player_value}", True, self.colors["LIGHT_BLUE"])
-            self.screen.blit(player_value_text, (500, 230))
-        
-        dealer_text = self.normal_font.render("Dealer Up Card:", True, self.colors["WHITE"])
+        if self.player_hands:
+            # One entry per split hand, the hand being played in yellow
+            x = 250
+            for i, hand in enumerate(self.player_hands):
+                color = self.colors["YELLOW"] if i == self.player_hands.active_index and len(self.player_hands) > 1 \
+                    else self.colors["LIGHT_BLUE"]
+                hand_text = self.normal_font.render(
+                    f"{','.join(hand.cards)} = {'soft ' if hand.soft else ''}{hand.total}", True, color)
+                self.screen.blit(hand_text, (x, 230))
+                x += hand_text.get_width() + 20
+        
+        dealer_text = self.static_text("Dealer Up Card:", 'normal_font', self.colors["WHITE"])
         self.screen.blit(dealer_text, (50, 270))
         
         if self.dealer_up_card:
             dealer_card_text = self.normal_font.render(self.dealer_up_card, True, self.colors["LIGHT_BLUE"])
             self.screen.blit(dealer_card_text, (250, 270))
+            
+            # Insurance is decided the moment the dealer shows an ace
+            insurance = strategy.get_insurance_recommendation(
+                self.player_hands.active, self.dealer_up_card, self.shoe.ten_density, self.true_count,
+                self.insurance_by_true_count)
+            if insurance:
+                basis = f"TC {self.true_count:+.1f}" if self.insurance_by_true_count \
+                    else f"tens {self.shoe.ten_density:.1%}"
+                insurance_text = self.normal_font.render(f"{insurance} ({basis})", True, self.colors["YELLOW"])
+                self.screen.blit(insurance_text, (300, 270))
         
         # Draw recommendation
         recommendation = self.get_recommendation()
-        rec_color = self.colors["RED"] if recommendation != "Need player and dealer cards" else self.colors["WHITE"]
+        rec_color = self.colors["RED"] if recommendation != strategy.NEED_CARDS else self.colors["WHITE"]
         rec_text = self.title_font.render(f"Recommendation: {recommendation}", True, rec_color)
         self.screen.blit(rec_text, rec_text.get_rect(center=(self.WINDOW_WIDTH/2, 330)))
         
+        # Dealer outcome odds for the up card at this true count
+        odds_surface = self.dealer_odds()
+        if odds_surface:
+            self.screen.blit(odds_surface, (50, 360))
+        
         # Draw camera feed and status
-        if self.camera_enabled and self.camera_surface:
+        state = self.state
+        if self.camera_enabled and state.camera_surface:
             # Draw camera feed on the right side (no flip, already rotated correctly)
-            self.screen.blit(self.camera_surface, (650, 100))
+            self.screen.blit(state.camera_surface, (650, 100))
             
             # Draw FPS text using Pygame (top-left of camera feed)
-            fps_text = self.small_font.render(f"FPS: {self.fps:.1f}", True, self.colors["GREEN"])
+            fps_text = self.small_font.render(f"FPS: {state.fps:.1f}{' (idle)' if state.capture_idle else ''}", True, self.colors["GREEN"])
             self.screen.blit(fps_text, (650 + 10, 100 + 10))
             
             # Draw a border around the camera feed
             pygame.draw.rect(self.screen, self.colors["WHITE"], (650, 100, 320, 240), 2)
             
             # Display detected card
-            card_text = self.normal_font.render("Card Detection:", True, self.colors["WHITE"])
+            card_text = self.static_text("Card Detection:", 'normal_font', self.colors["WHITE"])
             self.screen.blit(card_text, (650, 350))
             
-            detection_text = self.normal_font.render(self.detection_confidence, True, self.colors["YELLOW"])
+            detection_text = self.normal_font.render(state.detection_status, True, self.colors["YELLOW"])
             self.screen.blit(detection_text, (650, 390))
             
             # Show input mode, confirmation status and FPS
             mode_text = self.small_font.render(
                 f"Mode: {'Player Card' if self.input_mode == 'player' else 'Dealer Card' if self.input_mode == 'dealer' else 'None'} | " +
-                f"Confirmed: {'Yes' if self.detection_confirmed else 'No'}", 
+                f"Confirmed: {'Yes' if self.detection_pending() else 'No'}", 
                 True, self.colors["LIGHT_BLUE"]
             )
             self.screen.blit(mode_text, (650, 430))
+            
+            # Hit rate and latency of each detection tier, once the camera thread has built the cascade
+            if self._detection_cascade is not None:
+                tiers_text = self.small_font.render(self._detection_cascade.report(), True, self.colors["WHITE"])
+                self.screen.blit(tiers_text, (650, 455))
+            
+            # Vision API usage and estimated cost this session
+            usage_text = self.small_font.render(limiter.ledger.summary(), True, self.colors["WHITE"])
+            self.screen.blit(usage_text, (650, 480))
         else:
             # Display camera status
-            camera_status = self.normal_font.render("Camera: Disabled", True, self.colors["WHITE"])
+            camera_status = self.static_text("Camera: Disabled", 'normal_font', self.colors["WHITE"])
             self.screen.blit(camera_status, (650, 150))
-            camera_help = self.small_font.render("Press 'C' or click 'Toggle Camera'", True, self.colors["LIGHT_BLUE"])
+            camera_help = self.static_text("Press 'C' or click 'Toggle Camera'", 'small_font', self.colors["LIGHT_BLUE"])
             self.screen.blit(camera_help, (650, 190))
             
         # Draw card buttons
@@ -633,24 +921,77 @@ class CardCounterCam:
             self.message_timer -= 1
         
         # Draw shortcuts help
-        shortcuts_text = self.small_font.render("Shortcuts: C=Toggle Camera, P=Add Player Card, D=Set Dealer Card, Q=Quit", True, self.colors["WHITE"])
-        self.screen.blit(shortcuts_text, (self.WINDOW_WIDTH/2 - 300, 610))
+        if self.keyboard_entry.active:
+            shortcuts_text = self.static_text(keyboard_entry.HELP_TEXT, 'small_font', self.colors["YELLOW"])
+        else:
+            shortcuts_text = self.static_text("Shortcuts: C=Camera, P/D=Player/Dealer, S=Split, N=Next, W/L/T=Outcome, F2=Keys, Q=Quit", 'small_font', self.colors["WHITE"])
+        self.screen.blit(shortcuts_text, shortcuts_text.get_rect(center=(self.WINDOW_WIDTH/2, 620)))
         
         pygame.display.flip()
 
+    def toggle_tracing(self, profile=False):
+        """Start or stop recording a Chrome trace of the UI, camera and API threads"""
+        if tracer.enabled:
+            path = tracer.stop(self.trace_dir)
+            self.message = f"Trace written to {path}"
+        else:
+            tracer.start(profile=profile)
+            self.message = "Tracing on, press F9 again to save"
+        self.message_timer = 180
+
+    def report_startup(self):
+        """Print the time from process start to the first interactive frame"""
+        self.startup_time = time.perf_counter() - STARTED_AT
+        status = "OK" if self.startup_time <= STARTUP_TARGET else "over target"
+        print(f"First interactive frame after {self.startup_time * 1000:.0f} ms "
+              f"(target {STARTUP_TARGET * 1000:.0f} ms, {status})")
+
     def run(self):
         while self.running:
+            # Read the shared camera state once; events and drawing use this snapshot
+            self.state = self.camera_state.snapshot
+            if self.state.notice_id > self.shown_notice_id:
+                self.shown_notice_id = self.state.notice_id
+                self.message = self.state.notice
+                self.message_timer = 180
             self.handle_events()
             self.draw()
+            if self.startup_time is None:
+                self.report_startup()
             self.clock.tick(60)
         
         # Cleanup
-        self.camera_running = False
+        self.camera_stop.set()
         if self.camera_thread and self.camera_thread.is_alive():
             self.camera_thread.join(timeout=1.0)
-        
+        if tracer.enabled:
+            print(f"Trace written to {tracer.stop(self.trace_dir)}")
+        
+        if self.count_client:
+            self.count_client.close()
+        self.hand_history.flush()
+        # Fold this session's small chunks into the earlier ones
+        self.hand_history.compact()
         pygame.quit()
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Blackjack card counter with camera detection")
+    parser.add_argument('--startup-check', action='store_true',
+                        help="Exit after the first frame, with status 1 if startup missed its target")
+    args = parser.parse_args()
+    
+    # Load environment variables from .env file
+    load_dotenv()
+    limiter.configure(**limits_from_env())
+    
     counter = CardCounterCam()
-    counter.run() 
\ No newline at end of file
+    if args.startup_check:
+        counter.state = counter.camera_state.snapshot
+        counter.draw()
+        counter.report_startup()
+        pygame.quit()
+        sys.exit(0 if counter.startup_time <= STARTUP_TARGET else 1)
+    counter.run()
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
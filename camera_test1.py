@@ -1,20 +1,25 @@
 import cv2
 import numpy as np
-from PIL import Image
 import os
-import base64
-from io import BytesIO
-from openai import OpenAI
+import sys
+import argparse
+import csv
+import json
+import tarfile
+import zipfile
 from dotenv import load_dotenv
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from vision_payload import PayloadController, encode_frame_to_base64
+from vision_client import ResilientVisionClient, CircuitOpenError, VisionTimeoutError
+from rate_limiter import ThrottledError, limiter, limits_from_env
+from local_detector import LocalOCRDetector, DetectionCascade
+from detector_backend import PerFrameBackend
+from card_parsing import (parse_detection_json, build_detection_messages,
+                          DETECTION_RESPONSE_FORMAT, DETECTION_MAX_TOKENS)
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Get API key from environment variable
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("Please set your OpenAI API key in the .env file as OPENAI_API_KEY=your-key")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
 
 # Card counting values (Hi-Lo system)
 CARD_VALUES = {
@@ -43,15 +48,18 @@ class CardCounter:
         self.running_count = 0
         self.last_card = None
 
-def encode_image_to_base64(image):
-    # Convert PIL Image to base64 with JPEG compression (quality 80)
-    buffered = BytesIO()
-    image.save(buffered, format="JPEG", quality=80)
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+def create_client(source='camera', priority='high'):
+    """OpenAI client with deadlines, hedging, a circuit breaker and the shared rate limiter"""
+    # Imported here, the SDK is slow to import and batch runs may not need it
+    from openai import OpenAI
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("Please set your OpenAI API key in the .env file as OPENAI_API_KEY=your-key")
+    return ResilientVisionClient(OpenAI(api_key=api_key), source=source, priority=priority)
 
 def analyze_webcam():
-    # Initialize OpenAI client with API key
-    client = OpenAI(api_key=api_key)
+    # Initialize OpenAI client with deadlines, hedging and a circuit breaker
+    client = create_client()
     
     # Initialize webcam
     cap = cv2.VideoCapture(0)
@@ -68,6 +76,59 @@ def analyze_webcam():
     last_sent_time = 0
     send_interval = 2.0  # seconds
     
+    # Start at 480x360 for detail and let the controller shrink the payload
+    payload_controller = PayloadController(start_level=0)
+    
+    # Only one request in flight, the video keeps running while it waits
+    api_busy = threading.Event()
+    
+    def process_frame(frame):
+        try:
+            # Encode straight from the BGR frame (resized by the controller)
+            base64_image, payload_level = payload_controller.encode(frame)
+            request_start = time.time()
+            
+            # Call OpenAI Vision API for a structured answer
+            response = client.create(
+                model="gpt-4o",  # Structured outputs need gpt-4o
+                messages=build_detection_messages(base64_image),
+                max_tokens=DETECTION_MAX_TOKENS,
+                response_format=DETECTION_RESPONSE_FORMAT
+            )
+            
+            # Get the response and update count
+            text = response.choices[0].message.content
+            try:
+                cards = parse_detection_json(text)
+                parsed = True
+            except ValueError:
+                cards = []
+                parsed = False
+            if cards:
+                counter.update_count(cards[0].rank)
+                text = cards[0].describe()
+            elif parsed:
+                text = 'No card detected'
+            payload_controller.record(time.time() - request_start, parsed, payload_level)
+            print(f"Detected: {text} [{payload_controller.describe()}] [{limiter.ledger.summary()}]")
+        
+        except CircuitOpenError:
+            print("Vision API unavailable, skipping detection until it recovers")
+        
+        except ThrottledError as e:
+            print(f"{e}, skipping this frame")
+        
+        except VisionTimeoutError as e:
+            # Timeouts are what the payload controller needs to see on a slow uplink
+            payload_controller.record(client.timeout, None, payload_level)
+            print(f"{e}, skipping this frame")
+        
+        except Exception as e:
+            print("Error in OpenAI API call:", str(e))
+        
+        finally:
+            api_busy.clear()
+    
     while True:
         # Capture frame-by-frame
         ret, frame = cap.read()
@@ -83,51 +144,14 @@ def analyze_webcam():
             frame_count = 0
             start_time = time.time()
             
-        # Resize frame to 480x360 for better detail
-        small_frame = cv2.resize(frame, (480, 360))
-        pil_image = Image.fromarray(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB))
-        
-        # Send frame every 2 seconds
+        # Send frame every 2 seconds, without blocking the capture loop
         current_time = time.time()
-        if current_time - last_sent_time >= send_interval:
-            try:
-                # Encode image to base64 (JPEG)
-                base64_image = encode_image_to_base64(pil_image)
-                
-                # Call OpenAI Vision API
-                response = client.chat.completions.create(
-                    model="gpt-4-vision-preview",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text", 
-                                    "text": "Look at this image and identify if there is a playing card visible. If there is a card, respond with ONLY the card's value (2-10, J, Q, K, A) and suit (hearts, diamonds, clubs, spades) in the format 'value of suit' (e.g., '7 of hearts' or 'King of spades'). If no card is clearly visible, respond with 'No card detected'."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=20
-                )
-                
-                # Get the response and update count
-                text = response.choices[0].message.content.strip()
-                if text != 'No card detected':
-                    # Extract just the value from the response
-                    value = text.split()[0]
-                    counter.update_count(value)
-                print(f"Detected: {text}")
-                last_sent_time = current_time
-                    
-            except Exception as e:
-                print("Error in OpenAI API call:", str(e))
+        if current_time - last_sent_time >= send_interval and not api_busy.is_set():
+            api_busy.set()
+            last_sent_time = current_time
+            api_thread = threading.Thread(target=process_frame, args=(frame.copy(),))
+            api_thread.daemon = True
+            api_thread.start()
         
         # Add information to the frame
         cv2.putText(frame, f"FPS: {fps:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
@@ -150,5 +174,207 @@ def analyze_webcam():
     cap.release()
     cv2.destroyAllWindows()
 
-# Start the webcam analysis
-analyze_webcam()
+def openai_backend():
+    """Detector sending each image to the vision API"""
+    client = create_client(source='detector', priority='normal')
+    
+    def detect(frame):
+        base64_image = encode_frame_to_base64(frame, (320, 240))
+        response = client.create(
+            model="gpt-4o",
+            messages=build_detection_messages(base64_image),
+            max_tokens=DETECTION_MAX_TOKENS,
+            response_format=DETECTION_RESPONSE_FORMAT
+        )
+        return parse_detection_json(response.choices[0].message.content)
+    
+    return PerFrameBackend(detect)
+
+def ocr_backend():
+    """Local Tesseract OCR of the card's rank corner"""
+    detector = LocalOCRDetector()
+    if not detector.available:
+        raise RuntimeError("The ocr backend needs the tesseract binary installed")
+    return PerFrameBackend(detector.detect)
+
+def cascade_backend():
+    """Local OCR first, the vision API only when OCR is unsure"""
+    detector = LocalOCRDetector()
+    tiers = [('ocr', detector.detect, 0.85)] if detector.available else []
+    cascade = DetectionCascade(tiers + [('cloud', openai_backend().detect, None)],
+                               unavailable_errors=(CircuitOpenError, ThrottledError))
+    
+    def detect(frame):
+        return cascade.detect(frame)[0]
+    
+    return PerFrameBackend(detect, report=cascade.report)
+
+def onnx_backend():
+    """Batched ONNX card classifier on the CPU, loaded and warmed up here"""
+    # Imported here so the other backends don't need the model
+    from onnx_detector import OnnxCardClassifier, DEFAULT_MODEL_PATH
+    return OnnxCardClassifier(os.getenv('CARDCOUNTER_ONNX_MODEL', DEFAULT_MODEL_PATH))
+
+# Detector backends selectable with --backend, each factory returns a DetectorBackend
+BACKENDS = {
+    'openai': openai_backend,
+    'ocr': ocr_backend,
+    'cascade': cascade_backend,
+    'onnx': onnx_backend,
+}
+
+def iter_images(source):
+    """Yield (name, encoded image bytes) from a directory, .zip or .tar archive"""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    with open(path, 'rb') as f:
+                        yield os.path.relpath(path, source), f.read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"Not a directory or a zip/tar archive: {source}")
+
+def detect_images(backend, images):
+    """Run one detection batch and return a result row per image, with the batch latency"""
+    start = time.perf_counter()
+    rows = []
+    frames = []
+    for name, data in images:
+        rows.append({'image': name, 'rank': None, 'suit': None, 'confidence': None, 'cards': [], 'error': None})
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            rows[-1]['error'] = "Could not decode image"
+        else:
+            frames.append((rows[-1], frame))
+    
+    try:
+        results = backend.detect_batch([frame for _, frame in frames]) if frames else []
+    except Exception as e:
+        results = []
+        for row, _ in frames:
+            row['error'] = str(e)
+    for (row, _), cards in zip(frames, results):
+        row['cards'] = [card._asdict() for card in cards]
+        if cards:
+            row['rank'], row['suit'], row['confidence'] = cards[0]
+    
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    for row in rows:
+        row['latency_ms'] = latency_ms
+    return rows
+
+class ResultWriter:
+    """Stream result rows to a CSV or JSONL file (or stdout as JSONL)"""
+    
+    CSV_FIELDS = ['image', 'rank', 'suit', 'confidence', 'latency_ms', 'error', 'cards']
+    
+    def __init__(self, path, output_format=None):
+        if output_format is None:
+            output_format = 'csv' if path and path.lower().endswith('.csv') else 'jsonl'
+        self.format = output_format
+        self.file = open(path, 'w', newline='') if path else sys.stdout
+        if self.format == 'csv':
+            self.csv = csv.DictWriter(self.file, fieldnames=self.CSV_FIELDS)
+            self.csv.writeheader()
+    
+    def write(self, row):
+        if self.format == 'csv':
+            self.csv.writerow(dict(row, cards=json.dumps(row['cards'])))
+        else:
+            self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+    
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+def run_batch(source, backend='openai', workers=8, output=None, output_format=None):
+    """Detect cards in every image of `source` and stream the results"""
+    detector = BACKENDS[backend]()
+    # Images queue for the rate limiter instead of being dropped like live frames
+    limiter.max_wait = float('inf')
+    writer = ResultWriter(output, output_format)
+    latencies = []
+    detected = 0
+    errors = 0
+    start = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        
+        def collect(done):
+            nonlocal detected, errors
+            for future in done:
+                for row in future.result():
+                    writer.write(row)
+                    latencies.append(row['latency_ms'])
+                    if row['error']:
+                        errors += 1
+                    elif row['rank']:
+                        detected += 1
+        
+        batch = []
+        for image in iter_images(source):
+            batch.append(image)
+            if len(batch) < detector.batch_size:
+                continue
+            # Keep a bounded number of images in memory at once
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(detect_images, detector, batch))
+            batch = []
+        if batch:
+            pending.add(executor.submit(detect_images, detector, batch))
+        collect(wait(pending)[0])
+    
+    writer.close()
+    elapsed = time.perf_counter() - start
+    total = len(latencies)
+    latencies.sort()
+    
+    # Summary goes to stderr so stdout can carry the JSONL stream
+    print(f"Processed {total} images in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} images/s) "
+          f"with {workers} workers, backend '{backend}'", file=sys.stderr)
+    print(f"Detected: {detected}  No card: {total - detected - errors}  Errors: {errors}", file=sys.stderr)
+    if getattr(detector, 'report', None):
+        print(f"Tiers: {detector.report()}", file=sys.stderr)
+    if limiter.ledger.sources:
+        print(f"Vision API usage: {limiter.ledger.summary()}", file=sys.stderr)
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Latency p50: {p50:.0f} ms  p95: {p95:.0f} ms  max: {latencies[-1]:.0f} ms", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Blackjack card detection from a webcam or an image archive")
+    parser.add_argument('--batch', metavar='SOURCE',
+                        help="Directory, .zip or .tar of card images to label headlessly")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent detections in batch mode")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='openai', help="Detector backend")
+    parser.add_argument('--output', help="Result file (.csv or .jsonl), defaults to JSONL on stdout")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Override the output format")
+    args = parser.parse_args()
+    
+    # Load environment variables from .env file
+    load_dotenv()
+    limiter.configure(**limits_from_env())
+    
+    if args.batch:
+        run_batch(args.batch, args.backend, args.workers, args.output, args.format)
+    else:
+        analyze_webcam()
+
+if __name__ == "__main__":
+    main()
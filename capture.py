@@ -0,0 +1,64 @@
+import time
+
+import cv2
+
+
+def open_camera(index=0, size=(320, 240), fps=30):
+    """Open a camera, asking it for `size` natively.
+
+    Returns (cap, native) where native is True when the camera actually
+    delivers frames at `size`, so callers can skip resizing every frame.
+    """
+    cap = cv2.VideoCapture(index)
+    if not cap.isOpened():
+        return cap, False
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer for real-time processing
+    native = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) == tuple(size)
+    return cap, native
+
+
+class CaptureScheduler:
+    """Decide how often to read the camera from the motion in the scene.
+
+    Each frame is reduced to a tiny grayscale thumbnail by strided slicing
+    (no resize) and compared with the previous one. While the scene moves,
+    e.g. cards being dealt, frames are read as fast as the camera delivers
+    them; after `idle_after` seconds without motion the loop drops to
+    polling every `idle_interval` seconds until something moves again.
+    """
+
+    def __init__(self, idle_interval=0.25, idle_after=4.0, motion_threshold=4.0, step=16):
+        self.idle_interval = idle_interval  # Seconds between reads when idle
+        self.idle_after = idle_after  # Seconds without motion before going idle
+        self.motion_threshold = motion_threshold  # Mean absolute change, 0-255
+        self.step = step  # Thumbnail stride in pixels
+        self.previous = None
+        self.last_motion_time = time.time()
+        self.idle = False
+        self.changed = True  # Whether the last frame differed visibly from the one before
+
+    def observe(self, frame, now=None):
+        """Update the motion state from a new frame, returns the motion score"""
+        now = time.time() if now is None else now
+        thumbnail = cv2.cvtColor(frame[::self.step, ::self.step], cv2.COLOR_BGR2GRAY)
+        if self.previous is None or self.previous.shape != thumbnail.shape:
+            score = 255.0
+        else:
+            score = float(cv2.absdiff(thumbnail, self.previous).mean())
+        self.previous = thumbnail
+
+        # Sensor noise alone stays well under a quarter of the threshold
+        self.changed = score >= self.motion_threshold / 4
+        if score >= self.motion_threshold:
+            self.last_motion_time = now
+            self.idle = False
+        elif now - self.last_motion_time >= self.idle_after:
+            self.idle = True
+        return score
+
+    def delay(self):
+        """Seconds to sleep before the next read"""
+        return self.idle_interval if self.idle else 0.0
@@ -0,0 +1,150 @@
+import json
+import re
+from typing import NamedTuple
+
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+SUITS = {'h': 'hearts', 'd': 'diamonds', 'c': 'clubs', 's': 'spades'}
+
+# Cards asked for per frame, strict schemas cannot bound the list so the prompt does
+DETECTION_MAX_CARDS = 5
+
+# Most confident card first, so a stream's first card is the one best_card picks
+DETECTION_PROMPT = (
+    f"List the playing cards clearly visible in this image as JSON, at most {DETECTION_MAX_CARDS}, "
+    "most confident first. "
+    "rank is one of 2-10, J, Q, K, A; suit is h, d, c or s; confidence is 0-1. "
+    "Use an empty list if no card is visible."
+)
+
+# Strict structured output: the model can only answer with this shape,
+# keys in this order (rank and confidence first so a stream can commit early)
+DETECTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "card_detection",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "cards": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "rank": {"type": "string", "enum": list(RANKS)},
+                            "confidence": {"type": "number"},
+                            "suit": {"type": "string", "enum": list(SUITS)},
+                        },
+                        "required": ["rank", "confidence", "suit"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["cards"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# A compact answer is ~20 tokens per card plus the wrapper, room for the full list
+DETECTION_MAX_TOKENS = 16 + 24 * DETECTION_MAX_CARDS
+
+_RANK_SET = frozenset(RANKS)
+_CARD_KEYS = frozenset(('rank', 'confidence', 'suit'))
+_DECODER = json.JSONDecoder()
+
+# First card of a streamed answer, complete once the confidence number ends
+_FIRST_CARD_PREFIX = re.compile(
+    r'\s*\{\s*"cards"\s*:\s*\[\s*(?:(\])|\{\s*"rank"\s*:\s*"(10|[2-9JQKA])"\s*,'
+    r'\s*"confidence"\s*:\s*(\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*[,}])'
+)
+
+
+class CardDetection(NamedTuple):
+    rank: str
+    suit: str
+    confidence: float
+
+    def describe(self):
+        if self.suit not in SUITS:
+            # Suit unknown, e.g. from a streamed or local OCR detection
+            return f"{self.rank} ({self.confidence:.0%})"
+        return f"{self.rank} of {SUITS[self.suit]} ({self.confidence:.0%})"
+
+
+def build_detection_messages(base64_image):
+    """Chat messages asking for the structured detection of one JPEG frame"""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": DETECTION_PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                }
+            ]
+        }
+    ]
+
+
+def parse_detection_json(text):
+    """Parse and validate a structured detection answer.
+
+    Returns the detected cards, most confident first. Anything that is not
+    exactly the requested shape raises ValueError instead of being guessed at.
+    """
+    try:
+        data, end = _DECODER.raw_decode(text.strip())
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid detection JSON: {e}") from None
+    if end != len(text.strip()) or not isinstance(data, dict) or data.keys() != {'cards'}:
+        raise ValueError("Detection must be a single {\"cards\": [...]} object")
+    if not isinstance(data['cards'], list):
+        raise ValueError("Detection 'cards' must be a list")
+
+    cards = []
+    for item in data['cards']:
+        if not isinstance(item, dict) or item.keys() != _CARD_KEYS:
+            raise ValueError(f"Invalid card entry: {item!r}")
+        rank, suit, confidence = item['rank'], item['suit'], item['confidence']
+        if rank not in _RANK_SET or suit not in SUITS:
+            raise ValueError(f"Invalid card: {rank!r} of {suit!r}")
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) \
+                or not 0 <= confidence <= 1:
+            raise ValueError(f"Invalid confidence: {confidence!r}")
+        cards.append(CardDetection(rank, suit, float(confidence)))
+
+    cards.sort(key=lambda card: card.confidence, reverse=True)
+    return cards
+
+
+class IncrementalCardParser:
+    """Parse a streamed detection answer as the tokens arrive.
+
+    feed() returns True once the first card's rank and confidence are known
+    (or the card list is empty), which is well before the completion ends:
+    the rank is all the count needs, so the caller can commit it right away.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.rank = None
+        self.confidence = 0.0
+        self.done = False
+        self.no_card = False
+
+    def feed(self, delta):
+        if self.done or not delta:
+            return self.done
+        self.text += delta
+
+        match = _FIRST_CARD_PREFIX.match(self.text)
+        if match:
+            if match.group(1):
+                self.no_card = True
+            else:
+                self.rank = match.group(2)
+                self.confidence = min(1.0, float(match.group(3)))
+            self.done = True
+        return self.done
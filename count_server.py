@@ -0,0 +1,198 @@
+"""Team-play count server.
+
+Spotters (the UI, camera pipelines, scripts) connect over WebSockets and send
+card events as JSON; the server applies them to one shared shoe in arrival
+order and broadcasts the count and recommendation to every subscriber.
+
+    {"type": "card", "card": "7", "target": "player" | "dealer" | "other"}
+    {"type": "remove", "card": "7", "target": "player" | "dealer" | "other"}
+                                             undo a card sent by mistake
+    {"type": "new_hand"}
+    {"type": "reset_shoe", "decks": 6}
+    {"type": "unsubscribe"}                  send-only client, no broadcasts
+
+Run with: python count_server.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+import queue
+import threading
+
+from websockets.asyncio.server import serve, broadcast
+from websockets.asyncio.client import connect
+
+import strategy
+from shoe import Shoe
+from hand import Hand
+
+TARGETS = ('player', 'dealer', 'other')
+
+
+def parse_event(message):
+    """Decode and validate one client event, raises ValueError if malformed"""
+    try:
+        event = json.loads(message)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}") from None
+    if not isinstance(event, dict):
+        raise ValueError("Event must be a JSON object")
+
+    event_type = event.get('type')
+    if event_type in ('card', 'remove'):
+        if not isinstance(event.get('card'), str) or event['card'] not in strategy.COUNT_VALUES:
+            raise ValueError(f"Unknown card: {event.get('card')!r}")
+        target = event.setdefault('target', 'other')
+        if not isinstance(target, str) or target not in TARGETS:
+            raise ValueError(f"Unknown target: {event['target']!r}")
+    elif event_type == 'reset_shoe':
+        decks = event.setdefault('decks', None)
+        if decks is not None and (isinstance(decks, bool) or not isinstance(decks, int) or not 1 <= decks <= 8):
+            raise ValueError(f"Invalid deck count: {decks!r}")
+    elif event_type not in ('new_hand', 'unsubscribe'):
+        raise ValueError(f"Unknown event type: {event_type!r}")
+    return event
+
+
+class CountServer:
+    """Shared shoe state plus the set of connections subscribed to it"""
+
+    def __init__(self, num_decks=6):
+        self.shoe = Shoe(num_decks)
+        self.player_hand = Hand()
+        self.dealer_up_card = None
+        self.previous_up_cards = []  # Up cards replaced this hand, restored by a dealer remove
+        self.seq = 0  # Number of events applied so far
+        self.subscribers = set()
+
+    def apply(self, event):
+        """Apply one validated event to the shared state"""
+        event_type = event['type']
+        if event_type == 'card':
+            self.shoe.add(event['card'])
+            if event['target'] == 'player':
+                self.player_hand.add(event['card'])
+            elif event['target'] == 'dealer':
+                self.previous_up_cards.append(self.dealer_up_card)
+                self.dealer_up_card = event['card']
+        elif event_type == 'remove':
+            self.shoe.remove(event['card'])
+            if event['target'] == 'player' and self.player_hand.cards[-1:] == [event['card']]:
+                self.player_hand.pop()
+            elif event['target'] == 'dealer' and self.dealer_up_card == event['card']:
+                self.dealer_up_card = self.previous_up_cards.pop() if self.previous_up_cards else None
+        elif event_type == 'new_hand':
+            self.player_hand = Hand()
+            self.dealer_up_card = None
+            self.previous_up_cards.clear()
+        elif event_type == 'reset_shoe':
+            self.shoe.reset(event['decks'])
+            self.player_hand = Hand()
+            self.dealer_up_card = None
+            self.previous_up_cards.clear()
+        self.seq += 1
+
+    def state_message(self):
+        true_count = self.shoe.true_count
+        return json.dumps({
+            'type': 'state',
+            'seq': self.seq,
+            'running_count': self.shoe.running_count,
+            'true_count': round(true_count, 2),
+            'decks_remaining': round(self.shoe.decks_remaining, 2),
+            'cards_seen': self.shoe.cards_seen,
+            'player_cards': self.player_hand.cards,
+            'player_total': self.player_hand.total,
+            'soft': self.player_hand.soft,
+            'dealer_up_card': self.dealer_up_card,
+            'recommendation': strategy.get_recommendation(self.player_hand, self.dealer_up_card, true_count),
+            'ten_density': round(self.shoe.ten_density, 4),
+            'insurance': strategy.get_insurance_recommendation(self.player_hand, self.dealer_up_card,
+                                                               self.shoe.ten_density, true_count),
+        })
+
+    async def handler(self, websocket):
+        self.subscribers.add(websocket)
+        await websocket.send(self.state_message())
+        try:
+            async for message in websocket:
+                try:
+                    event = parse_event(message)
+                    if event['type'] == 'unsubscribe':
+                        self.subscribers.discard(websocket)
+                        continue
+                    # Applied synchronously on the event loop, so events from
+                    # all clients take effect one at a time in arrival order
+                    self.apply(event)
+                except ValueError as e:
+                    await websocket.send(json.dumps({'type': 'error', 'error': str(e)}))
+                    continue
+                # Serialize once, then queue the frame on every connection without waiting
+                broadcast(self.subscribers, self.state_message())
+        finally:
+            self.subscribers.discard(websocket)
+
+    async def serve_forever(self, host='127.0.0.1', port=8765):
+        # Small frames and no compression keep fan-out latency low on localhost
+        async with serve(self.handler, host, port, compression=None, max_size=2 ** 16):
+            print(f"Count server listening on ws://{host}:{port}")
+            await asyncio.Future()
+
+
+class CountServerClient:
+    """Thread-safe client for pushing card events from a non-async program.
+
+    Events are sent from a background thread running its own event loop;
+    the latest state broadcast by the server is kept in `state`.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.state = None
+        self.error = None
+        self.outbox = queue.SimpleQueue()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+        self.thread.start()
+
+    def send(self, event_type, **fields):
+        self.outbox.put(dict(fields, type=event_type))
+
+    def close(self):
+        self.outbox.put(None)
+
+    async def _run(self):
+        try:
+            async with connect(self.url) as websocket:
+                receiver = asyncio.create_task(self._receive(websocket))
+                loop = asyncio.get_running_loop()
+                while True:
+                    event = await loop.run_in_executor(None, self.outbox.get)
+                    if event is None:
+                        break
+                    await websocket.send(json.dumps(event))
+                receiver.cancel()
+        except Exception as e:
+            self.error = str(e)
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            data = json.loads(message)
+            if data.get('type') == 'state':
+                self.state = data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared count server for team play")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--decks', type=int, default=6, help="Decks in the shoe")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(CountServer(args.decks).serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Dealer outcome probabilities per up card and true count, precomputed offline.
+
+Build the table once with
+
+    python dealer_tables.py
+
+which writes dealer_tables.npy, a float32 array indexed by
+[true count bucket, up card, outcome]. The app memory-maps it at startup, and a
+lookup is just an index into that array.
+
+The remaining shoe at a true count is modelled by moving cards between the
+Hi-Lo low group (2-6) and high group (tens and aces): each point of true count
+takes a tenth of a card per deck from each low rank and spreads half a card per
+deck over the high ranks. The dealer then draws from that composition as from
+an infinite shoe.
+"""
+import argparse
+import os
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dealer_tables.npy')
+
+TRUE_COUNT_MIN = -10
+TRUE_COUNT_MAX = 10
+UPCARDS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'A')
+OUTCOMES = ('17', '18', '19', '20', '21', 'BJ', 'Bust')
+
+# Face cards share the ten's row
+UPCARD_INDEX = dict({card: i for i, card in enumerate(UPCARDS)}, J=8, Q=8, K=8)
+
+# Draw values of UPCARDS, aces as 1
+_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 1)
+
+
+def shoe_probabilities(true_count):
+    """Probability of drawing each of UPCARDS from a shoe at this true count"""
+    per_deck = np.array([4.0] * 8 + [16.0, 4.0])
+    per_deck[:5] -= true_count / 10
+    per_deck[8] += true_count / 2 * 16 / 20
+    per_deck[9] += true_count / 2 * 4 / 20
+    return per_deck / per_deck.sum()
+
+
+def dealer_outcomes(upcard, probabilities, hit_soft_17=False):
+    """Probabilities of OUTCOMES for the dealer showing `upcard`"""
+    memo = {}
+
+    def final(hard, aces):
+        key = (hard, aces)
+        if key in memo:
+            return memo[key]
+        soft = aces and hard + 10 <= 21
+        total = hard + 10 if soft else hard
+        result = np.zeros(len(OUTCOMES))
+        if total > 21:
+            result[OUTCOMES.index('Bust')] = 1.0
+        elif total >= 17 and not (hit_soft_17 and total == 17 and soft):
+            result[OUTCOMES.index(str(total))] = 1.0
+        else:
+            for value, p in zip(_VALUES, probabilities):
+                result += p * final(hard + value, aces or value == 1)
+        memo[key] = result
+        return result
+
+    up_value = _VALUES[UPCARD_INDEX[upcard]]
+    result = np.zeros(len(OUTCOMES))
+    for value, p in zip(_VALUES, probabilities):
+        if {up_value, value} == {1, 10}:
+            result[OUTCOMES.index('BJ')] += p
+        else:
+            result += p * final(up_value + value, up_value == 1 or value == 1)
+    return result
+
+
+def build_tables(hit_soft_17=False):
+    """Array of shape (true count buckets, len(UPCARDS), len(OUTCOMES))"""
+    true_counts = range(TRUE_COUNT_MIN, TRUE_COUNT_MAX + 1)
+    tables = np.zeros((len(true_counts), len(UPCARDS), len(OUTCOMES)), np.float32)
+    for i, true_count in enumerate(true_counts):
+        probabilities = shoe_probabilities(true_count)
+        for j, upcard in enumerate(UPCARDS):
+            tables[i, j] = dealer_outcomes(upcard, probabilities, hit_soft_17)
+    return tables
+
+
+class DealerTables:
+    """Read-only view of the precomputed table, memory-mapped"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.tables = np.load(path, mmap_mode='r')
+        expected = (TRUE_COUNT_MAX - TRUE_COUNT_MIN + 1, len(UPCARDS), len(OUTCOMES))
+        if self.tables.shape != expected:
+            raise ValueError(f"{path} has shape {self.tables.shape}, expected {expected}; rebuild it")
+
+    @staticmethod
+    def bucket(true_count):
+        """True count bucket a lookup falls into"""
+        return min(TRUE_COUNT_MAX, max(TRUE_COUNT_MIN, round(true_count)))
+
+    def lookup(self, upcard, true_count):
+        """Outcome probabilities (in OUTCOMES order) for an up card at a true count"""
+        return self.tables[self.bucket(true_count) - TRUE_COUNT_MIN, UPCARD_INDEX[upcard]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the dealer outcome probability table")
+    parser.add_argument('--output', default=DEFAULT_PATH, help="Where to write the .npy table")
+    parser.add_argument('--hit-soft-17', action='store_true', help="Dealer hits soft 17 (default: stands)")
+    args = parser.parse_args()
+
+    tables = build_tables(args.hit_soft_17)
+    np.save(args.output, tables)
+    print(f"Wrote {args.output} {tables.shape}")
+    neutral = -TRUE_COUNT_MIN
+    for upcard, row in zip(UPCARDS, tables[neutral]):
+        print(f"{upcard:>2}: bust {row[-1]:.1%}")
+
+
+if __name__ == '__main__':
+    main()
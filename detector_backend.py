@@ -0,0 +1,34 @@
+"""Detector backend protocol.
+
+A backend turns frames into detected cards, a whole batch at a time:
+
+    backend.detect_batch(frames) -> [cards, ...]
+
+with one list of CardDetection per frame, most confident first, and
+`batch_size`, the most frames it wants per call. Backends that handle one
+frame at a time (the vision API, OCR) are wrapped in PerFrameBackend;
+backends that gain from batching, like the cv2.dnn classifier, implement
+detect_batch themselves. Backends are registered by name in
+camera_test1.BACKENDS and selected with --backend or CARDCOUNTER_DETECTOR.
+"""
+from typing import Protocol
+
+
+class DetectorBackend(Protocol):
+    batch_size: int
+
+    def detect_batch(self, frames):
+        ...
+
+
+class PerFrameBackend:
+    """Backend calling a detect(frame) -> cards function for each frame"""
+
+    batch_size = 1
+
+    def __init__(self, detect, report=None):
+        self.detect = detect
+        self.report = report  # Optional callable returning a one-line summary
+
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
@@ -0,0 +1,164 @@
+"""Out-of-process card detection over a shared-memory frame ring.
+
+The UI process copies each frame into a preallocated slot of a
+multiprocessing.shared_memory block and sends only the slot index through a
+queue; the detector process reads the frame in place, so frames are never
+pickled. Encoding and the detector backend run on other cores, away from
+the pygame process and its GIL.
+"""
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+
+from rate_limiter import limiter, usage_since
+
+
+class SharedFrameRing:
+    """Fixed number of preallocated uint8 frame slots in shared memory"""
+
+    def __init__(self, slots=4, shape=(480, 640, 3), name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        size = slots * int(np.prod(shape))
+        if name is None:
+            self.shm = SharedMemory(create=True, size=size)
+        else:
+            # Attached from the detector process, the creator owns the block
+            self.shm = SharedMemory(name=name, track=False)
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, height, width):
+        """The frame stored in `slot`, without copying"""
+        return self.frames[slot, :height, :width]
+
+    def close(self, unlink=False):
+        del self.frames
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _detector_main(ring_name, slots, shape, backend, workers, tasks, results, limits):
+    """Detector process: run the backend on every frame slot it is handed"""
+    # Imported here so the UI process never loads the backend dependencies
+    from camera_test1 import BACKENDS
+
+    # The parent's limits, with whatever is left of its budget
+    limiter.configure(**limits)
+    reported = {}
+    usage_lock = threading.Lock()
+
+    ring = SharedFrameRing(slots, shape, name=ring_name)
+    # Created (and warmed up) before the first frame arrives
+    detector = BACKENDS[backend]()
+
+    # Tasks are only taken once a worker is free, frames that arrive meanwhile
+    # stay queued and go out together as the next batch
+    free_workers = threading.Semaphore(workers)
+
+    def run(batch):
+        nonlocal reported
+        try:
+            start = time.perf_counter()
+            frames = [ring.view(slot, height, width) for slot, _, height, width in batch]
+            try:
+                detected, error = detector.detect_batch(frames), None
+            except Exception as e:
+                detected, error = [[] for _ in batch], str(e)
+            latency = time.perf_counter() - start
+            # Vision API usage since the last result, for the parent's ledger and budget
+            with usage_lock:
+                current = limiter.ledger.snapshot()
+                usage, reported = usage_since(current, reported), current
+            for (slot, seq, _, _), cards in zip(batch, detected):
+                results.put((slot, seq, cards, error, latency, usage))
+                usage = {}
+        finally:
+            free_workers.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = True
+        while running:
+            free_workers.acquire()
+            batch = [tasks.get()]
+            # Batch whatever else is already queued, up to what the backend takes
+            while len(batch) < detector.batch_size:
+                try:
+                    batch.append(tasks.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = batch[:batch.index(None)]
+            if batch:
+                executor.submit(run, batch)
+            else:
+                free_workers.release()
+    ring.close()
+
+
+class DetectorProcess:
+    """Handle to a detector process fed through a SharedFrameRing.
+
+    submit() never blocks: when every slot is still being processed the
+    frame is dropped, which is the right backpressure for a live camera.
+    A slot is reused only after its result has been taken with get_result().
+    """
+
+    def __init__(self, backend='openai', slots=4, shape=(480, 640, 3), workers=2):
+        context = mp.get_context('spawn')
+        self.ring = SharedFrameRing(slots, shape)
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.free_slots = queue.SimpleQueue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        # The detector spends from what is left of this process's budget
+        limits = dict(limiter.limits, budget=limiter.remaining_budget)
+        self.process = context.Process(
+            target=_detector_main, name="card-detector", daemon=True,
+            args=(self.ring.name, slots, self.ring.shape, backend, workers, self.tasks, self.results, limits))
+        self.process.start()
+
+    def submit(self, frame, seq):
+        """Copy a BGR frame into a free slot and queue it, returns False if none is free"""
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            return False
+        max_height, max_width = self.ring.shape[:2]
+        if frame.shape[0] > max_height or frame.shape[1] > max_width:
+            frame = cv2.resize(frame, (max_width, max_height), interpolation=cv2.INTER_AREA)
+        height, width = frame.shape[:2]
+        np.copyto(self.ring.view(slot, height, width), frame)
+        self.tasks.put((slot, seq, height, width))
+        return True
+
+    def get_result(self, timeout=None):
+        """Next (seq, cards, error, latency), or None on timeout"""
+        try:
+            slot, seq, cards, error, latency, usage = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.free_slots.put(slot)
+        if usage:
+            # The detector's vision calls show in this process's usage line
+            limiter.record_usage(usage)
+        return seq, cards, error, latency
+
+    def close(self):
+        self.tasks.put(None)
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close(unlink=True)
@@ -0,0 +1,121 @@
+from strategy import card_value
+
+
+class Hand:
+    """One blackjack hand, kept up to date card by card.
+
+    Adding or removing a card is O(1): the hard total (aces as 1) and the
+    number of aces are updated in place, and the best total, soft flag and
+    pair flag are derived from them right away, so readers never rescan the
+    cards.
+    """
+
+    __slots__ = ('cards', 'hard_total', 'aces', 'total', 'soft', 'is_pair', 'from_split')
+
+    def __init__(self, cards=(), from_split=False):
+        self.cards = []
+        self.hard_total = 0
+        self.aces = 0
+        self.from_split = from_split
+        self._refresh()
+        for card in cards:
+            self.add(card)
+
+    def _refresh(self):
+        # At most one ace can count as 11
+        if self.aces and self.hard_total + 10 <= 21:
+            self.total = self.hard_total + 10
+            self.soft = True
+        else:
+            self.total = self.hard_total
+            self.soft = False
+        self.is_pair = len(self.cards) == 2 and card_value(self.cards[0]) == card_value(self.cards[1])
+
+    def add(self, card):
+        self.cards.append(card)
+        if card == 'A':
+            self.aces += 1
+            self.hard_total += 1
+        else:
+            self.hard_total += card_value(card)
+        self._refresh()
+
+    def pop(self):
+        """Remove and return the last card"""
+        card = self.cards.pop()
+        if card == 'A':
+            self.aces -= 1
+            self.hard_total -= 1
+        else:
+            self.hard_total -= card_value(card)
+        self._refresh()
+        return card
+
+    def split(self):
+        """Split a pair, this hand keeps the first card and the new hand gets the second"""
+        if not self.is_pair:
+            raise ValueError("Only a pair can be split")
+        second = Hand([self.pop()], from_split=True)
+        self.from_split = True
+        return second
+
+    @property
+    def is_blackjack(self):
+        return self.total == 21 and len(self.cards) == 2 and not self.from_split
+
+    @property
+    def is_bust(self):
+        return self.total > 21
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __bool__(self):
+        return bool(self.cards)
+
+    def __repr__(self):
+        return f"Hand({self.cards!r}, total={self.total}{', soft' if self.soft else ''})"
+
+
+class PlayerHands:
+    """The player's hands for the current round, one per split, each with its own outcome"""
+
+    __slots__ = ('hands', 'outcomes', 'active_index')
+
+    def __init__(self):
+        self.hands = [Hand()]
+        self.outcomes = ['unknown']
+        self.active_index = 0
+
+    @property
+    def active(self):
+        return self.hands[self.active_index]
+
+    def add(self, card):
+        self.active.add(card)
+
+    def split(self):
+        """Split the active hand; play continues on its first half"""
+        second = self.active.split()
+        self.hands.insert(self.active_index + 1, second)
+        self.outcomes.insert(self.active_index + 1, 'unknown')
+
+    def set_outcome(self, outcome):
+        """Outcome of the active hand, split hands are often decided differently"""
+        self.outcomes[self.active_index] = outcome
+
+    def next_hand(self):
+        """Move on to the next split hand, returns False if this was the last"""
+        if self.active_index + 1 < len(self.hands):
+            self.active_index += 1
+            return True
+        return False
+
+    def __iter__(self):
+        return iter(self.hands)
+
+    def __len__(self):
+        return len(self.hands)
+
+    def __bool__(self):
+        return any(self.hands)
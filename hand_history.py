@@ -0,0 +1,224 @@
+"""Columnar hand-history store.
+
+Every played hand is one row: player cards, dealer upcard, count at decision
+time, recommendation and outcome. Rows are buffered in memory and flushed as
+chunks, one directory per chunk with one .npy file per column. Queries
+memory-map the chunks and work on whole columns with NumPy, so aggregates
+over millions of hands take milliseconds. compact() merges runs of small
+chunks, e.g. the partial chunk every session writes on exit, into chunks of
+up to COMPACT_ROWS rows so queries do not pay per chunk.
+
+    python hand_history.py hand_history/     print win rate by true count and upcard
+"""
+import argparse
+import glob
+import os
+import shutil
+import time
+
+import numpy as np
+
+import strategy
+
+MAX_PLAYER_CARDS = 12
+
+# Rows a compacted chunk grows to
+COMPACT_ROWS = 65536
+
+# Card codes, 0 means no card; all ten-valued cards keep their own code
+CARD_CODES = {card: code for code, card in enumerate(strategy.CARDS, start=1)}
+CODE_CARDS = {code: card for card, code in CARD_CODES.items()}
+
+OUTCOMES = ('unknown', 'win', 'loss', 'push', 'blackjack', 'surrender')
+RECOMMENDATIONS = ('other', 'Hit', 'Stand', 'Double Down', 'Split', 'Surrender')
+
+# Column name -> (dtype, per-row shape)
+SCHEMA = {
+    'timestamp': ('f8', ()),
+    'player_cards': ('u1', (MAX_PLAYER_CARDS,)),
+    'player_total': ('u1', ()),
+    'dealer_upcard': ('u1', ()),
+    'running_count': ('i2', ()),
+    'true_count': ('f4', ()),
+    'decks_remaining': ('f4', ()),
+    'recommendation': ('u1', ()),
+    'outcome': ('u1', ()),
+}
+
+
+def chunk_range(path):
+    """(first, last) chunk number a chunk directory covers"""
+    first, _, last = os.path.basename(path)[len('chunk_'):].partition('-')
+    return int(first), int(last or first)
+
+
+class HandHistoryStore:
+    """Append-only store of played hands in chunked column files"""
+
+    def __init__(self, directory, chunk_size=65536):
+        self.directory = directory
+        self.chunk_size = chunk_size  # Rows buffered before a chunk is written
+        os.makedirs(directory, exist_ok=True)
+        paths = self.chunk_paths()
+        self.next_chunk = chunk_range(paths[-1])[1] + 1 if paths else 0
+        self._new_buffer()
+
+    def _new_buffer(self):
+        self.buffer = {name: np.zeros((self.chunk_size,) + shape, dtype)
+                       for name, (dtype, shape) in SCHEMA.items()}
+        self.buffered = 0
+
+    def chunk_paths(self):
+        """Complete chunks in row order.
+
+        A compacted chunk is named after the range of chunks it replaced,
+        chunk_000000-000255; chunks inside that range are left over from an
+        interrupted compact() and are skipped.
+        """
+        ranged = sorted((chunk_range(path), path) for path in glob.glob(os.path.join(self.directory, 'chunk_*'))
+                        if not path.endswith('.tmp'))
+        paths, covered = [], -1
+        # Sorted by first chunk, a compacted chunk comes before the first chunk it replaced
+        for (first, last), path in sorted(ranged, key=lambda item: (item[0][0], -item[0][1])):
+            if last > covered:
+                paths.append(path)
+                covered = last
+        return paths
+
+    def append(self, hand, dealer_up_card, running_count, true_count,
+               decks_remaining, recommendation, outcome='unknown', timestamp=None):
+        """Buffer one Hand, writing a chunk when the buffer is full"""
+        row = self.buffered
+        codes = [CARD_CODES[card] for card in hand.cards[:MAX_PLAYER_CARDS]]
+        self.buffer['player_cards'][row] = 0
+        self.buffer['player_cards'][row, :len(codes)] = codes
+        self.buffer['timestamp'][row] = time.time() if timestamp is None else timestamp
+        self.buffer['player_total'][row] = hand.total
+        self.buffer['dealer_upcard'][row] = CARD_CODES.get(dealer_up_card, 0)
+        self.buffer['running_count'][row] = running_count
+        self.buffer['true_count'][row] = true_count
+        self.buffer['decks_remaining'][row] = decks_remaining
+        self.buffer['recommendation'][row] = RECOMMENDATIONS.index(recommendation) \
+            if recommendation in RECOMMENDATIONS else 0
+        self.buffer['outcome'][row] = OUTCOMES.index(outcome)
+        self.buffered += 1
+        if self.buffered == self.chunk_size:
+            self.flush()
+
+    def append_columns(self, **columns):
+        """Write already-encoded column arrays straight out as one chunk"""
+        if set(columns) != set(SCHEMA):
+            raise ValueError(f"Columns must be exactly: {', '.join(SCHEMA)}")
+        self.flush()
+        self._write_chunk({name: np.asarray(values, SCHEMA[name][0]) for name, values in columns.items()})
+
+    def flush(self):
+        """Write buffered rows as a new chunk"""
+        if not self.buffered:
+            return
+        self._write_chunk({name: column[:self.buffered] for name, column in self.buffer.items()})
+        self._new_buffer()
+
+    def _write_chunk(self, columns, name=None):
+        if name is None:
+            name = f'chunk_{self.next_chunk:06d}'
+            self.next_chunk += 1
+        path = os.path.join(self.directory, name)
+        # Write into a temporary directory and rename, so readers never see half a chunk
+        tmp_path = path + '.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        for column_name, values in columns.items():
+            np.save(os.path.join(tmp_path, f'{column_name}.npy'), values)
+        os.replace(tmp_path, path)
+
+    def compact(self, max_rows=COMPACT_ROWS):
+        """Merge runs of consecutive chunks smaller than `max_rows` into one chunk each"""
+        runs, run, run_rows = [], [], 0
+        for path in self.chunk_paths():
+            rows = len(np.load(os.path.join(path, 'outcome.npy'), mmap_mode='r'))
+            if rows >= max_rows or run_rows + rows > max_rows:
+                runs.append(run)
+                run, run_rows = [], 0
+            if rows < max_rows:
+                run.append(path)
+                run_rows += rows
+        runs.append(run)
+
+        for run in runs:
+            if len(run) < 2:
+                continue
+            columns = {name: np.concatenate([np.load(os.path.join(path, f'{name}.npy')) for path in run])
+                       for name in SCHEMA}
+            first, last = chunk_range(run[0])[0], chunk_range(run[-1])[1]
+            # The merged chunk hides the old ones as soon as it exists, so they can go after it
+            self._write_chunk(columns, f'chunk_{first:06d}-{last:06d}')
+            for path in run:
+                shutil.rmtree(path)
+
+    def column(self, name):
+        """All flushed values of one column, memory-mapped chunk by chunk"""
+        chunks = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for path in self.chunk_paths()]
+        if not chunks:
+            dtype, shape = SCHEMA[name]
+            return np.zeros((0,) + shape, dtype)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    def __len__(self):
+        return len(self.column('outcome')) + self.buffered
+
+    def win_rate_by_true_count_and_upcard(self, bucket_size=1.0, min_true_count=-6, max_true_count=6):
+        """Win rate of decided hands grouped by true count bucket and dealer upcard.
+
+        Returns (bucket_starts, upcards, wins, hands) where wins and hands
+        are (len(bucket_starts), len(upcards)) arrays. True counts outside
+        the range fall into the first/last bucket; ten-valued upcards are
+        grouped together.
+        """
+        true_count = self.column('true_count')
+        upcard = self.column('dealer_upcard')
+        outcome = self.column('outcome')
+
+        n_buckets = int(np.ceil((max_true_count - min_true_count) / bucket_size))
+        bucket = np.floor((true_count - min_true_count) / bucket_size).astype(np.int64)
+        np.clip(bucket, 0, n_buckets - 1, out=bucket)
+
+        # Upcard value index 0..9 for 2..9, ten, ace
+        upcard_values = np.array([0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 8, 8, 8, 9], np.int64)
+        upcard_index = upcard_values[upcard]
+
+        decided = (outcome != OUTCOMES.index('unknown')) & (upcard != 0)
+        won = decided & ((outcome == OUTCOMES.index('win')) | (outcome == OUTCOMES.index('blackjack')))
+        key = bucket * 10 + upcard_index
+        hands = np.bincount(key[decided], minlength=n_buckets * 10).reshape(n_buckets, 10)
+        wins = np.bincount(key[won], minlength=n_buckets * 10).reshape(n_buckets, 10)
+
+        bucket_starts = min_true_count + np.arange(n_buckets) * bucket_size
+        upcards = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'A']
+        return bucket_starts, upcards, wins, hands
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hand history analytics")
+    parser.add_argument('directory', nargs='?', default='hand_history')
+    parser.add_argument('--bucket', type=float, default=1.0, help="True count bucket size")
+    parser.add_argument('--compact', action='store_true', help="Merge small chunks before querying")
+    args = parser.parse_args()
+
+    store = HandHistoryStore(args.directory)
+    if args.compact:
+        store.compact()
+    start = time.perf_counter()
+    bucket_starts, upcards, wins, hands = store.win_rate_by_true_count_and_upcard(args.bucket)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(store)} hands, query took {elapsed * 1000:.1f} ms")
+    print("TC     " + "".join(f"{card:>7}" for card in upcards))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = wins / hands
+    for start_tc, row, counts in zip(bucket_starts, rates, hands):
+        cells = "".join(f"{rate:7.1%}" if count else "      -" for rate, count in zip(row, counts))
+        print(f"{start_tc:+5.1f}  {cells}")
+
+
+if __name__ == "__main__":
+    main()
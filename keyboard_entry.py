@@ -0,0 +1,62 @@
+import pygame
+
+# One keystroke per rank
+RANK_KEYS = {
+    pygame.K_2: '2', pygame.K_3: '3', pygame.K_4: '4', pygame.K_5: '5',
+    pygame.K_6: '6', pygame.K_7: '7', pygame.K_8: '8', pygame.K_9: '9',
+    pygame.K_0: '10', pygame.K_t: '10', pygame.K_1: 'A',
+    pygame.K_j: 'J', pygame.K_q: 'Q', pygame.K_k: 'K', pygame.K_a: 'A',
+    pygame.K_KP2: '2', pygame.K_KP3: '3', pygame.K_KP4: '4', pygame.K_KP5: '5',
+    pygame.K_KP6: '6', pygame.K_KP7: '7', pygame.K_KP8: '8', pygame.K_KP9: '9',
+    pygame.K_KP0: '10', pygame.K_KP1: 'A',
+}
+
+TOGGLE_KEY = pygame.K_F2
+
+HELP_TEXT = "Keys: 2-9, 0/T=10, J Q K, A/1 | Shift=dealer, Ctrl/Alt=other seat | Bksp=undo | Esc=exit"
+
+
+class KeyboardEntry:
+    """Keyboard-only card entry.
+
+    Keystrokes are only buffered while events are read; the app drains the
+    buffer once per frame and applies the whole burst in one batch, so a
+    round of cards typed faster than the frame rate is never dropped.
+    Applied entries are kept on an undo stack.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.pending = []  # ('card', rank, target) or ('undo',) in key order
+        self.undo_stack = []  # Whatever the app needs to revert an applied entry
+
+    def toggle(self):
+        self.active = not self.active
+        self.pending.clear()
+
+    def handle_key(self, event):
+        """Buffer a KEYDOWN event, returns True if the entry mode consumed it"""
+        if event.key == TOGGLE_KEY or (self.active and event.key == pygame.K_ESCAPE):
+            self.toggle()
+            return True
+        if not self.active:
+            return False
+
+        if event.key == pygame.K_BACKSPACE or (event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL):
+            self.pending.append(('undo',))
+        elif event.key in RANK_KEYS:
+            if event.mod & pygame.KMOD_SHIFT:
+                target = 'dealer'
+            elif event.mod & (pygame.KMOD_CTRL | pygame.KMOD_ALT):
+                target = 'other'
+            else:
+                target = 'player'
+            self.pending.append(('card', RANK_KEYS[event.key], target))
+        # Swallow every other key so entry can't trigger the normal shortcuts
+        return True
+
+    def drain(self):
+        """Take all entries buffered since the last frame"""
+        entries = self.pending
+        self.pending = []
+        return entries
@@ -0,0 +1,144 @@
+"""Local card detection: find the card, crop its rank corner and OCR it.
+
+Runs in tens of milliseconds on a laptop CPU, so DetectionCascade tries it
+before paying for a cloud call.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+from card_parsing import CardDetection
+
+# Card warped to a fixed 5:7 portrait so the corner is always at the same place
+CARD_SIZE = (250, 350)
+RANK_CORNER = (slice(8, 62), slice(6, 44))  # rows, cols of the rank index
+OCR_CONFIG = "--psm 8 -c tessedit_char_whitelist=0123456789AJQK"
+VALID_RANKS = frozenset(('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A'))
+
+
+def order_corners(points):
+    """Order 4 points as top-left, top-right, bottom-right, bottom-left"""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], np.float32)
+
+
+def find_card(frame, min_area_ratio=0.02):
+    """Warp the largest card-like quadrilateral to CARD_SIZE, or None"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = frame.shape[0] * frame.shape[1] * min_area_ratio
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:3]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) != 4:
+            continue
+        corners = order_corners(approx)
+        width = np.linalg.norm(corners[1] - corners[0])
+        height = np.linalg.norm(corners[3] - corners[0])
+        if width > height:
+            # Landscape card, rotate so the rank corner ends up top-left
+            corners = np.roll(corners, -1, axis=0)
+        target = np.array([[0, 0], [CARD_SIZE[0] - 1, 0], [CARD_SIZE[0] - 1, CARD_SIZE[1] - 1],
+                           [0, CARD_SIZE[1] - 1]], np.float32)
+        matrix = cv2.getPerspectiveTransform(corners, target)
+        return cv2.warpPerspective(gray, matrix, CARD_SIZE)
+    return None
+
+
+class LocalOCRDetector:
+    """Rank detection with Tesseract on the cropped rank corner"""
+
+    def __init__(self):
+        try:
+            pytesseract.get_tesseract_version()
+            self.available = True
+        except (pytesseract.TesseractNotFoundError, OSError):
+            # The tesseract binary is not installed, the cascade skips this tier
+            self.available = False
+
+    def detect(self, frame):
+        """Detected cards (at most one, suit unknown), most confident first"""
+        card = find_card(frame)
+        if card is None:
+            return []
+
+        corner = card[RANK_CORNER]
+        corner = cv2.resize(corner, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
+        _, corner = cv2.threshold(corner, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        data = pytesseract.image_to_data(corner, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+
+        words = [(text.strip().upper(), float(conf)) for text, conf in zip(data['text'], data['conf'])
+                 if text.strip() and float(conf) >= 0]
+        if not words:
+            return []
+        rank, confidence = max(words, key=lambda word: word[1])
+        if rank not in VALID_RANKS:
+            return []
+        return [CardDetection(rank, '?', confidence / 100)]
+
+
+class DetectionCascade:
+    """Try detection tiers from cheapest to most expensive.
+
+    Each tier is (name, detect, min_confidence) where detect(frame) returns
+    cards sorted by confidence. A tier's answer is accepted when its best
+    card reaches min_confidence, otherwise the frame escalates to the next
+    tier. The last tier's answer is always accepted.
+
+    A tier that raises one of `unavailable_errors` (an open circuit breaker,
+    the rate limiter) is skipped for that frame: the most confident answer
+    of the tiers before it is returned instead, with the tier name marked
+    as degraded. Only when none of them found a card does the error propagate.
+    """
+
+    def __init__(self, tiers, unavailable_errors=()):
+        self.tiers = list(tiers)
+        self.unavailable_errors = tuple(unavailable_errors)
+        self.stats = {name: {'calls': 0, 'accepted': 0, 'seconds': 0.0} for name, _, _ in self.tiers}
+        self.lock = threading.Lock()
+
+    def detect(self, frame):
+        """Returns (cards, name of the tier that resolved the frame)"""
+        fallback = None  # (cards, tier name) of the most confident tier tried so far
+        for i, (name, detect, min_confidence) in enumerate(self.tiers):
+            start = time.perf_counter()
+            try:
+                cards = detect(frame)
+            except self.unavailable_errors:
+                with self.lock:
+                    self.stats[name]['calls'] += 1
+                    self.stats[name]['seconds'] += time.perf_counter() - start
+                if fallback is None:
+                    raise
+                return fallback[0], f"{fallback[1]} (degraded)"
+            if cards and (fallback is None or cards[0].confidence > fallback[0][0].confidence):
+                fallback = cards, name
+            accepted = i == len(self.tiers) - 1 or bool(cards and cards[0].confidence >= min_confidence)
+            with self.lock:
+                stats = self.stats[name]
+                stats['calls'] += 1
+                stats['seconds'] += time.perf_counter() - start
+                stats['accepted'] += accepted
+            if accepted:
+                return cards, name
+        return [], None
+
+    def report(self):
+        """Hit rate and average latency per tier, e.g. 'ocr 80% 24ms | cloud 100% 1400ms'"""
+        with self.lock:
+            parts = []
+            for name, stats in self.stats.items():
+                if stats['calls']:
+                    parts.append(f"{name} {stats['accepted'] / stats['calls']:.0%} "
+                                 f"{stats['seconds'] / stats['calls'] * 1000:.0f}ms")
+            return " | ".join(parts)
@@ -0,0 +1,245 @@
+"""Shared rate limiting and usage accounting for vision API calls.
+
+Every vision client in the process takes from the same two token buckets,
+requests per minute and tokens per minute, so all tables together stay
+under the provider limits instead of each one finding them with a 429. A
+detector process spends from a share of its parent's budget and reports
+its usage back, see record_usage().
+Sources have a priority: lower priorities must leave a reserve in the
+buckets, so under pressure background work is throttled first and the live
+tables keep detecting. A 429 pauses every source at once, and an optional
+budget in dollars stops all calls once it is spent.
+"""
+import os
+import threading
+import time
+
+# Fraction of each bucket a source of this priority must leave for the others
+PRIORITY_RESERVES = {'high': 0.0, 'normal': 0.25, 'low': 0.5}
+
+# Smallest request bucket in which a low priority request still leaves a request for high priority
+MIN_REQUEST_CAPACITY = 1 / (1 - max(PRIORITY_RESERVES.values()))
+
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+}
+
+# Tokens assumed for a source's first request, a small image plus the prompt
+DEFAULT_TOKEN_ESTIMATE = 500
+
+
+class ThrottledError(Exception):
+    """Raised instead of calling the API when the limiter or budget refuses"""
+
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`; not thread safe on its own"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve=0.0):
+        """Seconds until `amount` can be taken while leaving `reserve` of the capacity.
+
+        The reserve never takes more than the capacity left over by `amount`,
+        so with a small bucket every priority can still be served once it is full.
+        """
+        missing = amount + min(reserve * self.capacity, self.capacity - amount) - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class UsageLedger:
+    """Requests, tokens and estimated cost per source for this session"""
+
+    def __init__(self):
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def _source(self, source):
+        if source not in self.sources:
+            self.sources[source] = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                    'cost': 0.0, 'throttled': 0, 'measured': 0, 'measured_tokens': 0}
+        return self.sources[source]
+
+    def record(self, source, model, prompt_tokens, completion_tokens, measured=True):
+        input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES['gpt-4o'])
+        with self.lock:
+            stats = self._source(source)
+            stats['requests'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['cost'] += (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+            if measured:
+                stats['measured'] += 1
+                stats['measured_tokens'] += prompt_tokens + completion_tokens
+
+    def record_throttled(self, source):
+        with self.lock:
+            self._source(source)['throttled'] += 1
+
+    def snapshot(self):
+        """Copy of the per-source stats, e.g. to send to another process"""
+        with self.lock:
+            return {source: dict(stats) for source, stats in self.sources.items()}
+
+    def merge(self, usage):
+        """Add per-source stats recorded elsewhere, as returned by usage_since()"""
+        with self.lock:
+            for source, stats in usage.items():
+                totals = self._source(source)
+                for key, value in stats.items():
+                    totals[key] += value
+
+    def average_tokens(self, source):
+        """Mean tokens of the source's requests with reported usage, None before the first"""
+        with self.lock:
+            stats = self.sources.get(source)
+            if not stats or not stats['measured']:
+                return None
+            return stats['measured_tokens'] / stats['measured']
+
+    @property
+    def cost(self):
+        with self.lock:
+            return sum(stats['cost'] for stats in self.sources.values())
+
+    def summary(self):
+        """One line for the whole session, e.g. '42 calls 18.3k tokens $0.052 (3 throttled)'"""
+        with self.lock:
+            requests = sum(stats['requests'] for stats in self.sources.values())
+            tokens = sum(stats['prompt_tokens'] + stats['completion_tokens'] for stats in self.sources.values())
+            cost = sum(stats['cost'] for stats in self.sources.values())
+            throttled = sum(stats['throttled'] for stats in self.sources.values())
+        text = f"{requests} calls {tokens / 1000:.1f}k tokens ${cost:.3f}"
+        if throttled:
+            text += f" ({throttled} throttled)"
+        return text
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens shared by every vision client.
+
+    acquire() takes one request and the estimated tokens before a call, and
+    settle() corrects the token bucket with the usage the response reports.
+    A caller that cannot be served within `max_wait` seconds gets a
+    ThrottledError and should skip that frame rather than queue up.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=30000, budget=None,
+                 burst_seconds=10.0, max_wait=0.5):
+        self.lock = threading.Lock()
+        self.configure(requests_per_minute, tokens_per_minute, budget, burst_seconds)
+        self.max_wait = max_wait
+        self.paused_until = 0.0
+        self.ledger = UsageLedger()
+
+    def configure(self, requests_per_minute=60, tokens_per_minute=30000, budget=None, burst_seconds=10.0):
+        """Set the limits, with both buckets starting full"""
+        with self.lock:
+            # Even at a few requests per minute the bucket holds enough for the reserves to apply
+            self.requests = TokenBucket(requests_per_minute / 60,
+                                        max(MIN_REQUEST_CAPACITY, requests_per_minute / 60 * burst_seconds))
+            self.tokens = TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 60 * burst_seconds))
+            self.budget = budget  # USD for the session, None for no limit
+            self.limits = {'requests_per_minute': requests_per_minute, 'tokens_per_minute': tokens_per_minute,
+                           'budget': budget, 'burst_seconds': burst_seconds}
+
+    @property
+    def remaining_budget(self):
+        """USD left to spend, None without a budget"""
+        return None if self.budget is None else max(0.0, self.budget - self.ledger.cost)
+
+    def acquire(self, source, priority='normal', timeout=None):
+        """Reserve one request for `source`, returns the tokens reserved for settle()"""
+        if self.budget is not None and self.ledger.cost >= self.budget:
+            self.ledger.record_throttled(source)
+            raise ThrottledError(f"Vision budget of ${self.budget:.2f} is spent")
+
+        reserve = PRIORITY_RESERVES[priority]
+        estimate = self.ledger.average_tokens(source) or DEFAULT_TOKEN_ESTIMATE
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                # A request larger than the whole bucket may go once the bucket is full
+                wait = max(self.paused_until - now,
+                           self.requests.wait_time(1, reserve),
+                           self.tokens.wait_time(min(estimate, self.tokens.capacity), reserve))
+                if wait <= 0:
+                    self.requests.tokens -= 1
+                    self.tokens.tokens -= estimate
+                    return estimate
+            if now + wait > deadline:
+                self.ledger.record_throttled(source)
+                raise ThrottledError(f"Vision rate limit reached for {source} ({priority} priority)")
+            time.sleep(wait)
+
+    def settle(self, source, model, estimate, usage=None, completion_tokens=0):
+        """Account a finished request, using the response usage when it has one"""
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            # Stream closed before the usage chunk, assume the usual prompt size
+            prompt_tokens = max(0, estimate - completion_tokens)
+        with self.lock:
+            # Tokens may go negative, later requests then wait off the debt
+            self.tokens.tokens -= prompt_tokens + completion_tokens - estimate
+        self.ledger.record(source, model, prompt_tokens, completion_tokens, measured=usage is not None)
+
+    def record_usage(self, usage):
+        """Account calls another process made, e.g. the detector process.
+
+        They go into the ledger, so they show in the summary and count
+        against the budget, and are taken from the buckets so this
+        process's own calls leave room for them.
+        """
+        self.ledger.merge(usage)
+        with self.lock:
+            for stats in usage.values():
+                self.requests.tokens -= stats['requests']
+                self.tokens.tokens -= stats['prompt_tokens'] + stats['completion_tokens']
+
+    def penalize(self, seconds):
+        """The provider answered 429: pause every source and start the buckets empty"""
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.requests.tokens = min(self.requests.tokens, 0.0)
+            self.tokens.tokens = min(self.tokens.tokens, 0.0)
+
+
+def usage_since(current, previous):
+    """Per-source stats added between two UsageLedger snapshots, sources without change left out"""
+    usage = {}
+    for source, stats in current.items():
+        before = previous.get(source, {})
+        delta = {key: value - before.get(key, 0) for key, value in stats.items()}
+        if any(delta.values()):
+            usage[source] = delta
+    return usage
+
+
+def limits_from_env():
+    """RateLimiter.configure arguments from the VISION_* environment variables"""
+    return {
+        'requests_per_minute': float(os.getenv('VISION_REQUESTS_PER_MINUTE', 60)),
+        'tokens_per_minute': float(os.getenv('VISION_TOKENS_PER_MINUTE', 30000)),
+        'budget': float(os.environ['VISION_BUDGET_USD']) if os.getenv('VISION_BUDGET_USD') else None,
+    }
+
+
+# Process-wide limiter shared by every vision client, apps reconfigure it once .env is loaded
+limiter = RateLimiter(**limits_from_env())
@@ -0,0 +1,261 @@
+"""Replay labeled frame sequences through the detection pipeline and score the count.
+
+A session is a directory of frames plus a labels.csv listing them in order:
+
+    frame,card,time
+    0001.jpg,,0.000
+    0002.jpg,7,0.033
+    ...
+
+`card` is the card visible in that frame (empty for none) and `time` its
+capture time in seconds (optional, frames are spaced by --fps otherwise).
+Consecutive frames with the same card are one card event; leave at least
+one empty frame between two cards of the same rank.
+
+Each frame goes through the same steps as the live camera loop: the
+CaptureScheduler motion check and send interval, the detector, the
+stabilize_detection stability check and CardCounterCam.handle_detected_card
+once the detection cooldown has passed.
+Time is simulated, a detection result is applied once its latency has
+passed on the replay clock, so with a fixed --latency runs are fully
+deterministic. Every option takes a comma-separated list and all
+combinations are compared in one table:
+
+    python replay.py sessions/table1 sessions/table2 --backend app,onnx --required 1,2,3
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+# Replays run without a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import cv2
+from dotenv import load_dotenv
+
+import strategy
+from capture import CaptureScheduler
+from rate_limiter import limiter, limits_from_env
+from state_channel import stabilize_detection
+
+# The app's UI loop runs at 60 fps
+UI_FRAME_TIME = 1 / 60
+
+
+def load_session(directory, fps=30.0):
+    """[(time, frame path, true card or None)] in replay order"""
+    rows = []
+    with open(os.path.join(directory, 'labels.csv'), newline='') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            timestamp = float(row['time']) if row.get('time') else i / fps
+            rows.append((timestamp, os.path.join(directory, row['frame']), row.get('card') or None))
+    return rows
+
+
+def card_events(frames):
+    """[(card, start, end)] for every run of frames showing the same card"""
+    events = []
+    for timestamp, _, card in frames:
+        if card and events and events[-1][0] == card and events[-1][3]:
+            events[-1][2] = timestamp
+        elif card:
+            events.append([card, timestamp, timestamp, True])
+        if not card and events:
+            events[-1][3] = False  # The run ended
+    return [(card, start, end) for card, start, end, _ in events]
+
+
+def make_detector(app, backend):
+    """detect(frame) -> cards for a backend name, 'app' being the app's own cascade"""
+    if backend == 'app':
+        return lambda frame: app.detection_cascade.detect(frame)[0]
+    from camera_test1 import BACKENDS
+    detector = BACKENDS[backend]()
+    return lambda frame: detector.detect_batch([frame])[0]
+
+
+def replay_session(frames, config, app_factory):
+    """Run one session, returns [(count time, card)] and the detector latencies"""
+    app = app_factory()
+    app.count_client = None
+    app.input_mode = 'player'  # Count every confirmed card
+    app.send_interval = config['send_interval']
+    app.required_confirmations = config['required']
+    app.min_detection_confidence = config['min_confidence']
+    detect = make_detector(app, config['backend'])
+
+    scheduler = CaptureScheduler()
+    last_sent_time = float('-inf')
+    frame_seq = 0
+    in_flight = []  # (done time, seq, card, status, confidence)
+    counted = []
+    latencies = []
+
+    def ui_frame(now):
+        """What the UI loop does on a frame at `now`"""
+        while in_flight and in_flight[0][0] <= now:
+            done_at, seq, card, status, confidence = in_flight.pop(0)
+            app.camera_state.update(lambda state: stabilize_detection(
+                state, seq, card, status, confidence, done_at, app.required_confirmations))
+        app.state = app.camera_state.snapshot
+        # Same gate as CardCounterCam.handle_events, on the replay clock
+        if app.detection_pending() and now - app.state.last_detection_time > app.detection_cooldown:
+            app.handle_detected_card()
+            counted.append((now, app.last_detected_card))
+
+    for timestamp, path, _ in frames:
+        ui_frame(timestamp)
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f"Could not read frame {path}")
+        scheduler.observe(frame, now=timestamp)
+
+        # Same gating as camera_function: not idle, interval passed, a worker free
+        if scheduler.idle or timestamp - last_sent_time < app.send_interval or \
+                len(in_flight) >= app.max_detection_workers:
+            continue
+        last_sent_time = timestamp
+        frame_seq += 1
+        start = time.perf_counter()
+        try:
+            cards = detect(frame)
+        except Exception as e:
+            print(f"Detection failed on {path}: {e}", file=sys.stderr)
+            cards = []
+        latency = time.perf_counter() - start
+        latencies.append(latency)
+        card, status, confidence = app.best_card(cards)
+        delay = latency if config['latency'] is None else config['latency']
+        in_flight.append((timestamp + delay, frame_seq, card, status, confidence))
+
+    # Keep the UI running until the last results have landed and their cooldown is over
+    now = frames[-1][0] if frames else 0.0
+    while in_flight or app.detection_pending():
+        now += UI_FRAME_TIME
+        ui_frame(now)
+    return counted, latencies, app.running_count
+
+
+def score(events, counted, grace):
+    """Match counted cards to the labeled events"""
+    result = {'cards': len(events), 'counted': len(counted), 'correct': 0, 'missed': 0,
+              'duplicate': 0, 'wrong': 0, 'spurious': 0, 'card_latencies': []}
+    hits = [[] for _ in events]
+    for count_time, card in counted:
+        # The latest event that had started and was still in view, or just left it
+        index = None
+        for i, (_, start, end) in enumerate(events):
+            if start <= count_time <= end + grace:
+                index = i
+        if index is None:
+            result['spurious'] += 1
+        else:
+            hits[index].append((count_time, card))
+
+    for (true_card, start, _), event_hits in zip(events, hits):
+        correct = [count_time for count_time, card in event_hits if card == true_card]
+        result['wrong'] += len(event_hits) - len(correct)
+        if correct:
+            result['correct'] += 1
+            result['duplicate'] += len(correct) - 1
+            result['card_latencies'].append(correct[0] - start)
+        else:
+            result['missed'] += 1
+    return result
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(sessions, configs, fps=30.0, grace=2.0, app_factory=None):
+    """Replay every session under every config, returns one summary dict per config"""
+    if app_factory is None:
+        from CardCounterCam import CardCounterCam
+        app_factory = CardCounterCam
+    loaded = [load_session(directory, fps) for directory in sessions]
+
+    summaries = []
+    for config in configs:
+        total = {'cards': 0, 'counted': 0, 'correct': 0, 'missed': 0, 'duplicate': 0, 'wrong': 0,
+                 'spurious': 0, 'card_latencies': [], 'count_error': 0}
+        detector_latencies = []
+        for frames in loaded:
+            counted, latencies, running_count = replay_session(frames, config, app_factory)
+            events = card_events(frames)
+            result = score(events, counted, grace)
+            for key in result:
+                total[key] += result[key]
+            detector_latencies += latencies
+            true_count = sum(strategy.COUNT_VALUES[card] for card, _, _ in events)
+            total['count_error'] += abs(running_count - true_count)
+
+        card_latencies = total.pop('card_latencies')
+        total.update(config,
+                     card_latency_p50=percentile(card_latencies, 0.5),
+                     card_latency_p95=percentile(card_latencies, 0.95),
+                     detect_latency_p50=percentile(detector_latencies, 0.5))
+        summaries.append(total)
+    return summaries
+
+
+def parse_list(value, cast=str):
+    return [None if item == 'measured' else cast(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay labeled sessions and score card detection accuracy")
+    parser.add_argument('sessions', nargs='+', help="Session directories with frames and labels.csv")
+    parser.add_argument('--backend', default='app',
+                        help="Detector backends, 'app' for the app's own OCR/vision API cascade")
+    parser.add_argument('--send-interval', default='1.0', help="Seconds between frames sent for detection")
+    parser.add_argument('--required', default='2', help="Agreeing results before a card counts")
+    parser.add_argument('--min-confidence', default='0.6', help="Confidence below which results are ignored")
+    parser.add_argument('--latency', default='measured',
+                        help="Simulated detection latency in seconds, 'measured' to use the real one")
+    parser.add_argument('--fps', type=float, default=30.0, help="Frame rate when labels.csv has no times")
+    parser.add_argument('--grace', type=float, default=2.0,
+                        help="Seconds after a card leaves the view its count still belongs to it")
+    parser.add_argument('--json', action='store_true', help="Print the summaries as JSON lines")
+    args = parser.parse_args()
+
+    load_dotenv()
+    limiter.configure(**limits_from_env())
+
+    options = {
+        'backend': parse_list(args.backend),
+        'send_interval': parse_list(args.send_interval, float),
+        'required': parse_list(args.required, int),
+        'min_confidence': parse_list(args.min_confidence, float),
+        'latency': parse_list(args.latency, float),
+    }
+    configs = [dict(zip(options, values)) for values in itertools.product(*options.values())]
+    summaries = run(args.sessions, configs, args.fps, args.grace)
+
+    if args.json:
+        for summary in summaries:
+            print(json.dumps(summary))
+        return
+
+    def ms(value):
+        return '-' if value is None else f"{value * 1000:.0f}"
+
+    print(f"{'backend':<8} {'send':>5} {'req':>3} {'conf':>5} {'lat':>8} | {'cards':>5} {'ok':>4} {'miss':>4} "
+          f"{'dup':>4} {'wrong':>5} {'spur':>4} {'err':>4} | {'p50 ms':>7} {'p95 ms':>7} {'det ms':>7}")
+    for s in summaries:
+        latency = 'measured' if s['latency'] is None else f"{s['latency']:.2f}"
+        print(f"{s['backend']:<8} {s['send_interval']:>5.2f} {s['required']:>3} {s['min_confidence']:>5.2f} "
+              f"{latency:>8} | {s['cards']:>5} {s['correct']:>4} {s['missed']:>4} {s['duplicate']:>4} "
+              f"{s['wrong']:>5} {s['spurious']:>4} {s['count_error']:>4} | {ms(s['card_latency_p50']):>7} "
+              f"{ms(s['card_latency_p95']):>7} {ms(s['detect_latency_p50']):>7}")
+
+
+if __name__ == '__main__':
+    main()
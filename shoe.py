@@ -0,0 +1,51 @@
+from strategy import COUNT_VALUES, CARDS
+
+TEN_CARDS = ('10', 'J', 'Q', 'K')
+
+
+class Shoe:
+    """Running count and composition of the cards seen from one shoe"""
+
+    def __init__(self, num_decks=6):
+        self.reset(num_decks)
+
+    def reset(self, num_decks=None):
+        if num_decks is not None:
+            self.num_decks = num_decks
+        self.seen = dict.fromkeys(CARDS, 0)
+        self.cards_seen = 0
+        self.running_count = 0
+
+    def add(self, card):
+        if card not in self.seen:
+            raise ValueError(f"Unknown card: {card!r}")
+        self.seen[card] += 1
+        self.cards_seen += 1
+        self.running_count += COUNT_VALUES[card]
+
+    def remove(self, card):
+        """Undo a card added by mistake"""
+        if not self.seen.get(card):
+            raise ValueError(f"Card not seen: {card!r}")
+        self.seen[card] -= 1
+        self.cards_seen -= 1
+        self.running_count -= COUNT_VALUES[card]
+
+    def remaining(self, card):
+        return max(0, self.num_decks * 4 - self.seen[card])
+
+    @property
+    def ten_density(self):
+        """Fraction of the unseen cards worth ten"""
+        cards_left = self.num_decks * 52 - self.cards_seen
+        if cards_left <= 0:
+            return 0.0
+        return sum(self.remaining(card) for card in TEN_CARDS) / cards_left
+
+    @property
+    def decks_remaining(self):
+        return max(0.5, (self.num_decks * 52 - self.cards_seen) / 52)
+
+    @property
+    def true_count(self):
+        return self.running_count / self.decks_remaining
@@ -0,0 +1,89 @@
+import threading
+from dataclasses import dataclass, replace
+
+
+@dataclass(frozen=True, slots=True)
+class CameraState:
+    """Immutable snapshot of everything the camera side shares with the UI"""
+    camera_surface: object = None
+    fps: float = 0.0
+    camera_running: bool = False
+    capture_idle: bool = False  # Camera polled slowly because the scene is static
+    detected_card: str | None = None
+    detection_status: str = "No detection"
+    detection_confidence: float = 0.0  # Model confidence of the current detection
+    detection_id: int = 0  # Bumped every time a card is confirmed
+    last_detection_time: float = 0.0
+    candidate_card: str | None = None  # Stability check: last card seen ...
+    candidate_count: int = 0  # ... and how many results in a row agreed
+    last_frame_seq: int = 0  # Newest frame whose result has been applied
+    notice: str = ""  # Message for the UI ...
+    notice_id: int = 0  # ... shown once per new id
+
+
+class StateChannel:
+    """Publish/subscribe channel holding the latest CameraState.
+
+    Readers grab `snapshot` once per frame without taking a lock and get a
+    consistent view that never changes under them. Writers never mutate a
+    snapshot; they swap in a new one, serialized by a lock that is only held
+    for the swap itself, so adding detection workers adds no contention for
+    the UI loop.
+    """
+
+    def __init__(self, initial=None):
+        self._snapshot = initial or CameraState()
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def publish(self, **changes):
+        """Replace fields of the current snapshot"""
+        with self._lock:
+            self._snapshot = replace(self._snapshot, **changes)
+            return self._snapshot
+
+    def update(self, func):
+        """Atomically derive changes from the current snapshot.
+
+        `func(snapshot)` returns a dict of changes (or None to leave the
+        snapshot as it is). Use this for read-modify-write updates like the
+        detection stability check.
+        """
+        with self._lock:
+            changes = func(self._snapshot)
+            if changes:
+                self._snapshot = replace(self._snapshot, **changes)
+            return self._snapshot
+
+    def notify(self, notice):
+        """Post a one-off message for the UI"""
+        with self._lock:
+            self._snapshot = replace(self._snapshot, notice=notice, notice_id=self._snapshot.notice_id + 1)
+
+
+def stabilize_detection(state, frame_seq, card, status, confidence, now, required=2):
+    """Changes for a new detection result, for use with StateChannel.update.
+
+    A card is only confirmed once `required` results in a row agree; a clear
+    "no card" is shown straight away. Results for frames older than one
+    already applied are dropped, so overlapping workers can finish in any
+    order.
+    """
+    if frame_seq <= state.last_frame_seq:
+        return None
+
+    if card == state.candidate_card:
+        count = state.candidate_count + 1
+    else:
+        count = 1
+    changes = {'candidate_card': card, 'candidate_count': count, 'last_frame_seq': frame_seq}
+
+    # Only update detection if we have consistent readings or clear "no card"
+    if count >= required or card is None:
+        changes.update(detected_card=card, detection_status=status, detection_confidence=confidence)
+        if card is not None:
+            changes.update(detection_id=state.detection_id + 1, last_detection_time=now)
+    return changes
@@ -0,0 +1,66 @@
+"""Hi-Lo counting values and basic strategy, shared by the UI and the count server"""
+
+# Card values for Hi-Lo counting system
+COUNT_VALUES = {
+    '2': 1, '3': 1, '4': 1, '5': 1, '6': 1,
+    '7': 0, '8': 0, '9': 0,
+    '10': -1, 'J': -1, 'Q': -1, 'K': -1, 'A': -1
+}
+
+CARDS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+
+NEED_CARDS = "Need player and dealer cards"
+
+# Insurance pays 2:1, so it breaks even when exactly a third of the unseen cards are tens
+INSURANCE_TRUE_COUNT = 3  # Hi-Lo index for the true count approximation
+
+
+def card_value(card):
+    """Blackjack value of a card, aces counted as 11"""
+    if card in ('J', 'Q', 'K'):
+        return 10
+    if card == 'A':
+        return 11
+    return int(card)
+
+
+def get_insurance_recommendation(hand, dealer_up_card, ten_density, true_count, use_true_count=False):
+    """Insurance (even money with a blackjack) decision against an ace, None otherwise"""
+    if dealer_up_card != 'A' or len(hand) > 2:
+        return None
+    take = true_count >= INSURANCE_TRUE_COUNT if use_true_count else ten_density > 1 / 3
+    offer = "Even Money" if hand.is_blackjack else "Insurance"
+    return f"{'Take' if take else 'No'} {offer}"
+
+
+def get_recommendation(hand, dealer_up_card, true_count):
+    """Recommendation for a Hand against the dealer's up card"""
+    if not hand or not dealer_up_card:
+        return NEED_CARDS
+
+    player_value = hand.total
+    dealer_value = card_value(dealer_up_card)
+
+    # Basic strategy with count considerations
+    if player_value <= 8:
+        return "Hit"
+    elif player_value == 9:
+        if dealer_value in [3,4,5,6] and true_count >= 1:
+            return "Double Down"
+        return "Hit"
+    elif player_value == 10:
+        if dealer_value <= 9:
+            return "Double Down"
+        return "Hit"
+    elif player_value == 11:
+        return "Double Down"
+    elif player_value == 12:
+        if dealer_value in [4,5,6]:
+            return "Stand"
+        return "Hit"
+    elif 13 <= player_value <= 16:
+        if dealer_value <= 6:
+            return "Stand"
+        return "Hit"
+    else:  # 17 or higher
+        return "Stand"
@@ -0,0 +1,124 @@
+"""Lightweight span tracing that exports Chrome trace-event JSON.
+
+Open the written file in chrome://tracing or https://ui.perfetto.dev to see
+where each frame's time went, per thread. When tracing is off, `span()`
+returns a shared no-op context manager and `traced` functions make a single
+attribute check before running, so the hooks can stay in hot paths.
+"""
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Tracer:
+    """Collects complete ("X") trace events from any thread"""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.thread_names = {}
+        self.profiler = None
+        self.started_at = 0
+
+    def start(self, profile=False):
+        """Begin a tracing session, optionally with cProfile on the calling thread"""
+        self.events = []
+        self.thread_names = {}
+        self.started_at = time.perf_counter_ns()
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.enabled = True
+
+    def stop(self, directory='traces'):
+        """End the session and write the trace (and profile), returns the trace path"""
+        self.enabled = False
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(directory, f'trace-{stamp}.json')
+
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in self.thread_names.items()]
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.started_at) / 1000, 'dur': (end - start) / 1000, 'args': args}
+                  for name, tid, start, end, args in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(directory, f'profile-{stamp}.prof'))
+            self.profiler = None
+        self.events = []
+        return path
+
+    def record(self, name, start, end, args=None):
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        # list.append is atomic, so threads can record without a lock
+        self.events.append((name, tid, start, end, args or {}))
+
+    def span(self, name, **args):
+        """Context manager timing its block as one event"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+
+# Process-wide tracer used by all the hooks
+tracer = Tracer()
+
+
+def traced(name=None):
+    """Decorator recording every call of a function as a span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.record(span_name, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
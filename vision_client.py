@@ -0,0 +1,256 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from rate_limiter import ThrottledError, limiter as shared_limiter
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class VisionTimeoutError(TimeoutError):
+    """Raised when no response arrived before the request deadline"""
+
+
+class CircuitBreaker:
+    """Stop calling a failing upstream and probe it again after a pause.
+
+    closed    -> requests go through, consecutive failures are counted
+    open      -> requests are refused until `reset_timeout` has passed
+    half_open -> a single probe request is let through; success closes
+                 the circuit, failure opens it again
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout  # Seconds to stay open
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            # Open, or half open with the probe already in flight
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def release(self):
+        """A request that was allowed through was never sent"""
+        with self.lock:
+            if self.state == 'half_open':
+                # Let the next request be the probe instead
+                self.state = 'open'
+
+    @property
+    def is_open(self):
+        return self.state != 'closed'
+
+
+class ResilientVisionClient:
+    """Wrap an OpenAI client with deadlines, hedging, backoff and a breaker.
+
+    Every call gets a hard deadline. If the first request is still pending
+    once it exceeds the `hedge_percentile` of recent latencies, a duplicate
+    request is fired and whichever answers first wins. Rate limits are
+    retried with exponential backoff, and repeated failures open the
+    circuit so callers can fall back to manual entry straight away.
+
+    Every request, hedges included, first takes its share of the shared
+    RateLimiter as `source` with `priority`; hedges go at low priority and
+    are skipped when the limiter can't spare them.
+    """
+
+    def __init__(self, client, timeout=4.0, hedge_percentile=0.9, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None, history=50,
+                 limiter=None, source='default', priority='normal'):
+        # The SDK is slow to import, only load it with the first client
+        import openai
+        self.rate_limit_error = openai.RateLimitError
+        # Retries are handled here, not inside the SDK
+        self.client = client.with_options(max_retries=0)
+        self.timeout = timeout  # Seconds per request, including hedges
+        self.hedge_percentile = hedge_percentile
+        self.max_retries = max_retries  # Retries after a rate limit
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or shared_limiter
+        self.source = source
+        self.priority = priority
+        self.latencies = deque(maxlen=history)
+        self.hedges_sent = 0
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vision")
+
+    def hedge_delay(self):
+        """Latency after which a duplicate request is sent, None until warmed up"""
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return min(ordered[index], self.timeout)
+
+    def create(self, **kwargs):
+        """Drop-in for chat.completions.create with the resilience policies"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Vision API circuit is open")
+
+        attempt = 0
+        while True:
+            try:
+                start = time.time()
+                response = self._hedged_call(kwargs)
+                self.latencies.append(time.time() - start)
+                self.breaker.record_success()
+                return response
+            except ThrottledError:
+                # Refused locally before anything was sent, the upstream is fine
+                self.breaker.release()
+                raise
+            except self.rate_limit_error as e:
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt, e)
+                # Every table backs off, not just the one that hit the limit
+                self.limiter.penalize(delay)
+                time.sleep(delay)
+                attempt += 1
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+    def stream(self, **kwargs):
+        """Yield the text deltas of a streamed completion as they arrive.
+
+        Streams are not hedged, but they share the deadline, rate-limit
+        backoff and circuit breaker. Closing the generator early (once the
+        caller has what it needs) closes the HTTP stream too.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Vision API circuit is open")
+
+        attempt = 0
+        start = time.time()
+        while True:
+            try:
+                estimate = self.limiter.acquire(self.source, self.priority)
+            except ThrottledError:
+                self.breaker.release()
+                raise
+            try:
+                response = self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, timeout=self.timeout, **kwargs)
+                break
+            except self.rate_limit_error as e:
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt, e)
+                self.limiter.penalize(delay)
+                time.sleep(delay)
+                attempt += 1
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+        deadline = time.time() + self.timeout
+        usage = None
+        deltas = 0
+        try:
+            for chunk in response:
+                if time.time() > deadline:
+                    raise VisionTimeoutError(f"Vision stream exceeded {self.timeout:.1f}s")
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    deltas += 1
+                    yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            # Caller stopped early, which is a successful request
+            pass
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            response.close()
+            # Roughly one token per delta when the usage chunk never arrived
+            self.limiter.settle(self.source, kwargs['model'], estimate, usage, completion_tokens=deltas)
+        self.latencies.append(time.time() - start)
+        self.breaker.record_success()
+
+    def _backoff(self, attempt, error):
+        """Seconds to wait before retrying a rate-limited request"""
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff_base * (2 ** attempt)
+        # Full jitter so several tables don't retry in lockstep
+        return min(self.backoff_max, delay) * random.uniform(0.5, 1.0)
+
+    def _hedged_call(self, kwargs):
+        estimate = self.limiter.acquire(self.source, self.priority)
+        started = threading.Event()
+        futures = [self.executor.submit(self._call, kwargs, estimate, started)]
+        # Waiting for a free executor thread is local queueing, not upstream latency,
+        # so the deadline only starts once the request is actually sent
+        started.wait()
+        deadline = time.time() + self.timeout
+
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                try:
+                    # A hedge is a luxury, never wait for it
+                    hedge_estimate = self.limiter.acquire(self.source, 'low', timeout=0)
+                except ThrottledError:
+                    pass
+                else:
+                    self.hedges_sent += 1
+                    futures.append(self.executor.submit(self._call, kwargs, hedge_estimate, threading.Event()))
+
+        last_error = None
+        while futures:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+
+        if last_error is not None and not futures:
+            raise last_error
+        raise VisionTimeoutError(f"No vision response within {self.timeout:.1f}s")
+
+    def _call(self, kwargs, estimate, started):
+        started.set()
+        response = self.client.chat.completions.create(timeout=self.timeout, **kwargs)
+        self.limiter.settle(self.source, kwargs['model'], estimate, response.usage)
+        return response
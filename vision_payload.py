@@ -0,0 +1,112 @@
+import base64
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# Payload levels from largest to smallest: (width, height, JPEG quality)
+PAYLOAD_LEVELS = [
+    (480, 360, 85),
+    (400, 300, 80),
+    (320, 240, 80),
+    (320, 240, 70),
+    (288, 216, 60),
+    (256, 192, 55),
+    (224, 168, 50),
+    (192, 144, 45),
+]
+
+
+def encode_frame_to_base64(frame, size=None, quality=80):
+    """Encode a BGR frame straight to a base64 JPEG string.
+
+    cv2.imencode works on the BGR buffer directly, so there is no
+    BGR->RGB conversion and no PIL Image wrapper on the send path.
+    """
+    # Only ever shrink, upscaling a low-resolution capture adds bytes but no detail
+    if size is not None and frame.shape[1] > size[0]:
+        frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return base64.b64encode(buffer).decode('ascii')
+
+
+class PayloadController:
+    """Pick the resolution and JPEG quality for each vision request.
+
+    Every result reports its round-trip latency and whether the response
+    parsed into a card, or None for a request that got no answer (timed out
+    or failed upstream), which counts towards the latency only. While the current level parses reliably and the
+    latency is above target the controller steps down to a smaller
+    payload; as soon as the parse rate drops it steps back up and treats
+    the failing level as a floor for a while.
+    """
+
+    def __init__(self, levels=None, start_level=2, target_latency=1.0,
+                 min_success_rate=0.8, window=6, floor_hold=60.0):
+        self.levels = list(levels or PAYLOAD_LEVELS)
+        self.level = min(start_level, len(self.levels) - 1)
+        self.target_latency = target_latency  # Seconds
+        self.min_success_rate = min_success_rate
+        self.window = window  # Results needed before the level can move
+        self.floor_hold = floor_hold  # Seconds a failing level stays blocked
+        self.floor_level = len(self.levels) - 1
+        self.floor_until = 0
+        self.results = deque(maxlen=window)
+        self.last_payload_bytes = 0
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        width, height, _ = self.levels[self.level]
+        return width, height
+
+    @property
+    def quality(self):
+        return self.levels[self.level][2]
+
+    def encode(self, frame):
+        """Encode a frame at the current level, returns (base64_image, level)"""
+        with self.lock:
+            level = self.level
+        width, height, quality = self.levels[level]
+        base64_image = encode_frame_to_base64(frame, (width, height), quality)
+        self.last_payload_bytes = len(base64_image) * 3 // 4
+        return base64_image, level
+
+    def record(self, latency, parsed, level=None):
+        """Record the outcome of one request sent at `level`, `parsed` None if it got no answer"""
+        with self.lock:
+            # Ignore late results from a level we already moved away from
+            if level is not None and level != self.level:
+                return
+            self.results.append((latency, None if parsed is None else bool(parsed)))
+            if len(self.results) < self.window:
+                return
+
+            # Unanswered requests say nothing about how well this level parses
+            answered = [ok for _, ok in self.results if ok is not None]
+            success_rate = sum(answered) / len(answered) if answered else 1.0
+            avg_latency = sum(lat for lat, _ in self.results) / len(self.results)
+            now = time.time()
+            if now >= self.floor_until:
+                self.floor_level = len(self.levels) - 1
+
+            if success_rate < self.min_success_rate and self.level > 0:
+                # Accuracy is degrading, don't come back here for a while
+                self.floor_level = self.level - 1
+                self.floor_until = now + self.floor_hold
+                self._move(self.level - 1)
+            elif (success_rate >= self.min_success_rate and avg_latency > self.target_latency
+                  and self.level < self.floor_level):
+                self._move(self.level + 1)
+
+    def _move(self, level):
+        self.level = level
+        self.results.clear()
+
+    def describe(self):
+        width, height, quality = self.levels[self.level]
+        return f"{width}x{height} q{quality} ({self.last_payload_bytes // 1024} KB)"